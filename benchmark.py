@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+# No buttons or LEDs are attached when benchmarking, so gpiozero gets its mock pins.
+os.environ.setdefault("GPIOZERO_PIN_FACTORY", "mock")
+
+from PIL import ImageFont
+
+from pizzazz.emulator import EmulatedSSD1306
+from pizzazz.framebuffer import PageFrameBuffer
+from pizzazz.glyphs import GlyphAtlas, PRINTABLE_ASCII
+from pizzazz.ui import MenuWindow, DualScreenWindowManager, DEFAULT_FONT_PATH, DEFAULT_FONT_SIZE
+from pizzazz.utils import Font, ImageFontTextWrapper, monotonic_ns
+
+##########
+# Rendering benchmarks, run against the emulated SSD1306 so no hardware is needed.
+#   python benchmark.py --save baseline.json
+#   python benchmark.py --compare baseline.json
+##########
+
+LONG_TEXT = ("Sensor channel 3 reports 21.4C at 40% relative humidity. Pressure is steady at 1013 hPa, and the "
+             "last calibration finished without warnings. ") * 8
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * percent / 100.0), len(ordered) - 1)]
+
+
+def measure(name, operation, duration):
+    operation()
+    samples = []
+    deadline = monotonic_ns() + int(duration * 1e9)
+    while monotonic_ns() < deadline:
+        start = monotonic_ns()
+        operation()
+        samples.append(monotonic_ns() - start)
+    total = sum(samples)
+    return {
+        "name": name,
+        "runs": len(samples),
+        "ops_per_sec": len(samples) / (total / 1e9) if total else 0,
+        "p50_ms": percentile(samples, 50) / 1e6,
+        "p99_ms": percentile(samples, 99) / 1e6,
+    }
+
+
+def build_menu(title, count):
+    menu = MenuWindow(title)
+    for i in xrange(count):
+        menu.add_menu_item("Menu item {}".format(i), None)
+    return menu
+
+
+def bench_menu_full_redraw():
+    menu = build_menu("Full redraw", 12)
+    menu.screen = EmulatedSSD1306(0x3C)
+    menu.position = 0
+
+    def operation():
+        menu.invalidate()
+        menu.redraw()
+    return operation
+
+
+def bench_menu_position():
+    menu = build_menu("Position", 12)
+    menu.screen = EmulatedSSD1306(0x3C)
+    menu.position = 0
+    menu.redraw()
+    step = [1]
+
+    def operation():
+        if not 0 < menu.position + step[0] < 11:
+            step[0] = -step[0]
+        menu.position += step[0]
+        menu.redraw()
+    return operation
+
+
+def bench_focus_swap():
+    window_manager = DualScreenWindowManager(EmulatedSSD1306(0x3D), EmulatedSSD1306(0x3C))
+    window_manager.left_window = build_menu("Left", 4)
+    window_manager.right_window = build_menu("Right", 4)
+    window_manager.scheduler.flush()
+    left = [True]
+
+    def operation():
+        left[0] = not left[0]
+        window_manager.focus_left() if left[0] else window_manager.focus_right()
+        window_manager.scheduler.flush()
+    return operation
+
+
+def bench_menu_back_stack():
+    window_manager = DualScreenWindowManager(EmulatedSSD1306(0x3D), EmulatedSSD1306(0x3C))
+    menus = [build_menu("Level {}".format(level), 6) for level in xrange(4)]
+    window_manager.left_window = menus[0]
+    window_manager.right_window = build_menu("Right", 4)
+    window_manager.scheduler.flush()
+    depth = [0]
+    step = [1]
+
+    def operation():
+        if not 0 <= depth[0] + step[0] < len(menus):
+            step[0] = -step[0]
+        depth[0] += step[0]
+        if step[0] > 0:
+            window_manager.push_window(DualScreenWindowManager.LEFT, menus[depth[0]])
+        else:
+            window_manager.pop_window(DualScreenWindowManager.LEFT)
+        window_manager.scheduler.flush()
+    return operation
+
+
+def bench_text_wrap():
+    font = Font()
+    font.font = DEFAULT_FONT_PATH, DEFAULT_FONT_SIZE
+    wrapper = ImageFontTextWrapper(width=124, font=font)
+    return lambda: wrapper.wrap(LONG_TEXT)
+
+
+def bench_font_load():
+    path = os.path.abspath(DEFAULT_FONT_PATH)
+    return lambda: ImageFont.truetype(path, DEFAULT_FONT_SIZE)
+
+
+def bench_glyph_atlas_build():
+    path = os.path.abspath(DEFAULT_FONT_PATH)
+    return lambda: GlyphAtlas(path, DEFAULT_FONT_SIZE, PRINTABLE_ASCII)
+
+
+def bench_glyph_cache_load():
+    path = os.path.abspath(DEFAULT_FONT_PATH)
+    cache_dir = tempfile.mkdtemp(prefix="pizzazz-glyphs-")
+    GlyphAtlas(path, DEFAULT_FONT_SIZE, PRINTABLE_ASCII, cache_dir=cache_dir)
+    return lambda: GlyphAtlas(path, DEFAULT_FONT_SIZE, cache_dir=cache_dir)
+
+
+def bench_frame_encode():
+    # Windows drawing through ImageDraw still pay for this conversion; MenuWindow draws packed and skips it.
+    screen = EmulatedSSD1306(0x3C)
+    menu = build_menu("Encode", 4)
+    menu.position = 0
+    image = screen.rasterize(menu).to_image()
+    return lambda: PageFrameBuffer.from_image(image)
+
+
+BENCHMARKS = [
+    ("menu_full_redraw", bench_menu_full_redraw),
+    ("menu_position", bench_menu_position),
+    ("focus_swap", bench_focus_swap),
+    ("menu_back_stack", bench_menu_back_stack),
+    ("text_wrap", bench_text_wrap),
+    ("font_load", bench_font_load),
+    ("glyph_atlas_build", bench_glyph_atlas_build),
+    ("glyph_cache_load", bench_glyph_cache_load),
+    ("frame_encode", bench_frame_encode),
+]
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    previous = dict((result["name"], result) for result in baseline)
+    for result in results:
+        before = previous.get(result["name"])
+        if before is None:
+            continue
+        change = (result["p50_ms"] - before["p50_ms"]) / before["p50_ms"] if before["p50_ms"] else 0
+        result["p50_change"] = change
+        if change > threshold:
+            regressions.append(result["name"])
+    return regressions
+
+
+def report(results, regressions, stream=sys.stdout):
+    stream.write("{:<18} {:>8} {:>12} {:>10} {:>10} {:>9}\n".format("benchmark", "runs", "ops/sec", "p50 ms",
+                                                                    "p99 ms", "vs base"))
+    for result in results:
+        change = "{:+.1%}".format(result["p50_change"]) if "p50_change" in result else "-"
+        flag = " REGRESSION" if result["name"] in regressions else ""
+        stream.write("{:<18} {:>8} {:>12.1f} {:>10.3f} {:>10.3f} {:>9}{}\n".format(
+            result["name"], result["runs"], result["ops_per_sec"], result["p50_ms"], result["p99_ms"], change, flag))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Pizzazz rendering against an emulated display.")
+    parser.add_argument("--duration", type=float, default=1.0, help="seconds to run each benchmark")
+    parser.add_argument("--only", action="append", help="run just the named benchmark; may be repeated")
+    parser.add_argument("--save", metavar="PATH", help="write the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="flag benchmarks slower than this baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="p50 slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    results = []
+    for name, setup in BENCHMARKS:
+        if args.only and name not in args.only:
+            continue
+        results.append(measure(name, setup(), args.duration))
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+    report(results, regressions)
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,8 @@
-from sense_hat import SenseHat
+from pizzazz.startup import StartupProfile
 
-from pizzazz.ui import MenuWindow, WindowManager
-from pizzazz.display import SSD1306
+with StartupProfile().phase("imports"):
+    from pizzazz.ui import MenuWindow, DualScreenWindowManager
+    from pizzazz.display import SSD1306
 
 ##########
 # ssd1306 driver used is from - https://ssd1306.readthedocs.io/en/latest/
@@ -17,25 +18,35 @@ class Sensor(object):
     #####
     def __init__(self):
         super(Sensor, self).__init__()
-        self.hat = SenseHat()
+        self._hat = None
+
+    @property
+    def hat(self):
+        # sense_hat is slow to import and set up, so both wait until a reading is first asked for.
+        if self._hat is None:
+            from sense_hat import SenseHat
+            self._hat = SenseHat()
+        return self._hat
 
 
 #####
 # Program init
-screen_left = SSD1306(I2C_ADDR_LEFT)
-screen_right = SSD1306(I2C_ADDR_RIGHT)
-wm = WindowManager(screen_left, screen_right)
-
-menu_left = MenuWindow("Main Menu")
-items_left = ["System Info", "Options", "Reboot"]
-for title in items_left:
-    menu_left.add_menu_item(title, None)
-wm.left_window = menu_left
-
-menu_right = MenuWindow("Super Phun Thyme")
-items_right = ["Going on down to", "     South Park", "gonna have myself", "             a time"]
-for title in items_right:
-    menu_right.add_menu_item(title, None)
-wm.right_window = menu_right
+with StartupProfile().phase("window manager"):
+    screen_left = SSD1306(I2C_ADDR_LEFT)
+    screen_right = SSD1306(I2C_ADDR_RIGHT)
+    wm = DualScreenWindowManager(screen_left, screen_right)
+
+with StartupProfile().phase("windows"):
+    menu_left = MenuWindow("Main Menu")
+    items_left = ["System Info", "Options", "Reboot"]
+    for title in items_left:
+        menu_left.add_menu_item(title, None)
+    wm.left_window = menu_left
+
+    menu_right = MenuWindow("Super Phun Thyme")
+    items_right = ["Going on down to", "     South Park", "gonna have myself", "             a time"]
+    for title in items_right:
+        menu_right.add_menu_item(title, None)
+    wm.right_window = menu_right
 
 wm.start()
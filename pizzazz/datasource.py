@@ -0,0 +1,117 @@
+from collections import OrderedDict
+
+from utils import not_implemented
+
+
+class AbstractMenuDataSource(object):
+
+    def __init__(self):
+        super(AbstractMenuDataSource, self).__init__()
+
+    @property
+    def paged(self):
+        """
+        True when items are expensive to produce and should be fetched a page at a time through a cache.
+        """
+        return True
+
+    def count(self):
+        raise NotImplementedError(not_implemented(self, "count()"))
+
+    def get_items(self, start, stop):
+        """
+        Returns the items from index start up to, but not including, stop.
+        """
+        raise NotImplementedError(not_implemented(self, "get_items()"))
+
+    def get_item(self, index):
+        return self.get_items(index, index + 1)[0]
+
+    def prefetch(self, start, stop):
+        pass
+
+    def clear(self):
+        pass
+
+
+class ListMenuDataSource(AbstractMenuDataSource):
+
+    def __init__(self, items=None):
+        super(ListMenuDataSource, self).__init__()
+        self._items = list(items) if items is not None else []
+
+    @property
+    def paged(self):
+        return False
+
+    def add_item(self, item, index=None):
+        if index is not None:
+            self._items.insert(index, item)
+        else:
+            self._items.append(item)
+
+    def count(self):
+        return len(self._items)
+
+    def get_items(self, start, stop):
+        return self._items[start:stop]
+
+    def get_item(self, index):
+        return self._items[index]
+
+
+class CachedMenuDataSource(AbstractMenuDataSource):
+
+    DEFAULT_PAGE_SIZE = 32
+    DEFAULT_MAX_PAGES = 8
+
+    def __init__(self, source, page_size=DEFAULT_PAGE_SIZE, max_pages=DEFAULT_MAX_PAGES):
+        super(CachedMenuDataSource, self).__init__()
+        self._source = source
+        self._page_size = page_size
+        self._max_pages = max_pages
+        self._pages = OrderedDict()
+        self._count = None
+
+    @property
+    def source(self):
+        return self._source
+
+    def count(self):
+        if self._count is None:
+            self._count = self._source.count()
+        return self._count
+
+    def _get_page(self, page):
+        items = self._pages.get(page)
+        if items is not None:
+            del self._pages[page]
+        else:
+            start = page * self._page_size
+            items = self._source.get_items(start, min(start + self._page_size, self.count()))
+            if len(self._pages) >= self._max_pages:
+                self._pages.popitem(last=False)
+        self._pages[page] = items
+        return items
+
+    def get_item(self, index):
+        return self._get_page(index // self._page_size)[index % self._page_size]
+
+    def get_items(self, start, stop):
+        return [self.get_item(index) for index in xrange(start, min(stop, self.count()))]
+
+    def prefetch(self, start, stop):
+        """
+        Loads the pages covering the range along with the page on either side of it, so scrolling a little in either
+        direction never waits on the source.
+        """
+        if stop <= start:
+            return
+        first = max(start // self._page_size - 1, 0)
+        last = min((stop - 1) // self._page_size + 1, (self.count() - 1) // self._page_size)
+        for page in xrange(first, last + 1):
+            self._get_page(page)
+
+    def clear(self):
+        self._pages.clear()
+        self._count = None
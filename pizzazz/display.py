@@ -1,23 +1,147 @@
-from oled.device import ssd1306
-from oled.render import canvas
+import logging
+import threading
+from Queue import Queue
+from collections import namedtuple
 
-from utils import not_implemented
+import numpy
+from PIL import Image, ImageDraw
+
+from framebuffer import PageFrameBuffer, PAGE_HEIGHT
+from render import clip_rect
+from latency import LatencyTracer, MARK_RASTER_START, MARK_RASTER_END, MARK_TRANSFER_START, MARK_TRANSFER_END
+from startup import StartupProfile
+from stats import get_stats
+from utils import not_implemented, monotonic_ns
+
+logger = logging.getLogger(__name__)
+
+# Tuples
+PageRun = namedtuple("PageRun", "page start end")
+BusWrite = namedtuple("BusWrite", "command data")
+
+# SSD1306 addressing commands
+COLUMNADDR = 0x21
+PAGEADDR = 0x22
+
+
+class I2CBusWorker(object):
+
+    # Frames waiting on the bus before the render thread is made to wait for it.
+    DEFAULT_DEPTH = 2
+
+    def __init__(self, port, depth=DEFAULT_DEPTH):
+        super(I2CBusWorker, self).__init__()
+        self._port = port
+        self._queue = Queue(depth)
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._port
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="I2CBusWorker-{}".format(self._port))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def drain(self):
+        self._queue.join()
+
+    def submit(self, screen, writes, traces=()):
+        self._queue.put((screen, writes, traces))
+
+    @staticmethod
+    def write(screen, writes, traces=()):
+        LatencyTracer.mark(traces, MARK_TRANSFER_START)
+        start = monotonic_ns()
+        byte_count = 0
+        try:
+            for write in writes:
+                screen.device.command(*write.command)
+                screen.device.data(write.data)
+                byte_count += len(write.command) + len(write.data)
+        except Exception:
+            # Part of the frame may have reached the panel, so what it shows no longer matches the last frame sent.
+            logger.exception("Sending a frame to %s failed.", screen.name)
+            screen.invalidate()
+            LatencyTracer().complete(traces)
+            return
+        if writes:
+            get_stats().transferred(screen.name, screen.port, byte_count, monotonic_ns() - start)
+            StartupProfile().frame_sent(screen.name)
+        LatencyTracer.mark(traces, MARK_TRANSFER_END)
+        LatencyTracer().complete(traces)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    break
+                self.write(*item)
+            except Exception:
+                # The worker outlives a bad frame; the render thread would otherwise block on a queue nobody reads.
+                logger.exception("I2C bus worker on port %s failed to send a frame.", self._port)
+            finally:
+                self._queue.task_done()
+
+
+_bus_workers = {}
+_bus_workers_lock = threading.Lock()
+
+
+def get_bus_worker(port):
+    with _bus_workers_lock:
+        worker = _bus_workers.get(port)
+        if worker is None:
+            worker = I2CBusWorker(port)
+            _bus_workers[port] = worker
+        return worker
 
 
 class AbstractI2CScreen(object):
 
-    # TODO: Work in more of a common interface that uses the PIL objects sent to a master draw() method
     __FILL_SOLID = 255
     __FILL_EMPTY = 0
 
     def __init__(self, i2c_address, i2c_port=1):
         self.address = i2c_address
         self.port = i2c_port
-        self._device = self._request_device()
+        self._window = None
+        self._worker = None
+        self._overlay = None
+        self._recorder = None
+        self._device = None
 
     def _request_device(self):
         raise NotImplemented(not_implemented(self, "_request_device()"))
 
+    @property
+    def name(self):
+        return "0x{:02x}@i2c-{}".format(self.address, self.port)
+
+    @property
+    def device(self):
+        """
+        The driver for the display, set up on first use so that opening the bus does not hold up start-up.
+        """
+        if self._device is None:
+            self._device = self._request_device()
+        return self._device
+
     @property
     def fill_solid(self):
         return self.__FILL_SOLID
@@ -26,6 +150,42 @@ class AbstractI2CScreen(object):
     def fill_empty(self):
         return self.__FILL_EMPTY
 
+    @property
+    def worker(self):
+        """
+        When set, writes are handed to the bus worker so the next frame can be rasterized while this one is sent.
+        """
+        return self._worker
+
+    @worker.setter
+    def worker(self, value):
+        self._worker = value
+
+    @property
+    def overlay(self):
+        """
+        A callable taking (screen, canvas) that draws over every frame sent, without touching the window's frame. The
+        canvas is a PageFrameBuffer.
+        """
+        return self._overlay
+
+    @overlay.setter
+    def overlay(self, value):
+        self._overlay = value
+        # The next frame is diffed in full so the old overlay cannot linger outside the window's damage.
+        self._window = None
+
+    @property
+    def recorder(self):
+        """
+        A FrameRecorder that every frame sent to this screen is appended to, or None.
+        """
+        return self._recorder
+
+    @recorder.setter
+    def recorder(self, value):
+        self._recorder = value
+
     @property
     def width(self):
         raise NotImplemented(not_implemented(self, "width()"))
@@ -34,28 +194,174 @@ class AbstractI2CScreen(object):
     def height(self):
         raise NotImplemented(not_implemented(self, "height()"))
 
+    def _new_image(self):
+        return Image.new("1", (self.width, self.height), self.fill_empty)
+
+    def _new_frame(self):
+        return PageFrameBuffer(self.width, self.height, self.fill_empty)
+
+    def _draw(self, window, rect=None):
+        # Windows drawing with the rest of the ImageDraw API get an image, converted once they are done with it.
+        if window.PACKED_CANVAS:
+            frame = canvas = self._new_frame()
+        else:
+            image = self._new_image()
+            canvas = ImageDraw.Draw(image)
+        if rect is None:
+            window.draw(self, canvas)
+        else:
+            window.draw_region(self, canvas, rect)
+        return frame if window.PACKED_CANVAS else PageFrameBuffer.from_image(image)
+
+    def rasterize(self, window, damage=None, frame=None):
+        """
+        Draws the window into a new PageFrameBuffer, or when given a frame and damage rects, redraws only those rects
+        of it.
+        """
+        if damage is None or frame is None:
+            return self._draw(window)
+        for rect in damage:
+            rect = clip_rect(rect, self.width, self.height)
+            if rect is None:
+                continue
+            # Drawn off to the side so that shapes straddling the rect cannot touch pixels outside of it.
+            frame.paste(self._draw(window, rect), rect)
+        return frame
+
     def draw_window(self, window):
-        raise NotImplementedError(not_implemented(self, "draw_window()"))
+        traces = window.take_traces()
+        LatencyTracer.mark(traces, MARK_RASTER_START)
+        if window.invalid:
+            start = monotonic_ns()
+            damage = window.render(self)
+            get_stats().window_drawn(window.name, monotonic_ns() - start)
+            get_stats().frame_rendered(self.name)
+        else:
+            damage = window.render(self)
+            # Re-presenting an unchanged window, as the stats overlay does, only counts when it replaces another.
+            if window is not self._window:
+                get_stats().frame_rendered(self.name)
+        if window is not self._window:
+            damage = None
+        self._window = window
+        self._present(window.frame, damage, traces)
+
+    def draw_frame(self, frame, traces=()):
+        """
+        Sends a frame that is not the current one of any window, such as a window's cached frame shown while it redraws.
+        """
+        self._window = None
+        self._present(frame, None, traces)
+
+    def _present(self, frame, damage=None, traces=()):
+        if self._overlay is not None:
+            frame = frame.copy()
+            self._overlay(self, frame)
+            damage = None
+        if self._recorder is not None:
+            self._recorder.record(self, frame)
+        self._display(frame, damage, traces)
+
+    def invalidate(self):
+        """
+        Makes the next draw re-send the whole screen. Safe to call from the bus worker.
+        """
+        pass
 
     def clear_screen(self):
-        raise NotImplemented(not_implemented(self, "clear_screen()"))
+        # The window shown until now has to be drawn again, or its next refresh() would find nothing to do.
+        if self._window is not None:
+            self._window.invalidate()
+        self._window = None
+        frame = self._new_frame()
+        if self._recorder is not None:
+            self._recorder.record(self, frame)
+        self._display(frame)
+
+    def _display(self, frame, damage=None, traces=()):
+        raise NotImplementedError(not_implemented(self, "_display()"))
+
+    def _send(self, writes, traces=()):
+        LatencyTracer.mark(traces, MARK_RASTER_END)
+        if not writes and not traces:
+            return
+        if self._worker is not None and self._worker.running:
+            self._worker.submit(self, writes, traces)
+        else:
+            I2CBusWorker.write(self, writes, traces)
 
 
 class SSD1306(AbstractI2CScreen):
 
     __SCREEN_WIDTH = 128
     __SCREEN_HEIGHT = 64
+    # Unchanged columns shorter than this are re-sent rather than paying for another addressing command.
+    __MIN_COLUMN_GAP = 8
+
+    def __init__(self, i2c_address, i2c_port=1):
+        super(SSD1306, self).__init__(i2c_address, i2c_port)
+        self._last_frame = None
+        self._resend = False
 
     def _request_device(self):
+        from oled.device import ssd1306
         return ssd1306(port=self.port, address=self.address)
 
-    def draw_window(self, window):
-        with canvas(self._device) as draw:
-            window.draw(self, draw)
+    def invalidate(self):
+        """
+        Forgets the last frame sent so the next draw re-sends the whole screen.
+        """
+        # Only flagged here: the bus worker calls this while the render thread may be diffing against _last_frame.
+        self._resend = True
 
-    def clear_screen(self):
-        with canvas(self._device) as draw:
-            draw.rectangle((0, 0, self.width, self.height), fill=0)
+    def _damaged_columns(self, damage):
+        # Maps each page touched by the damage rects to the GDDRAM column span covering them.
+        columns = {}
+        for rect in damage:
+            rect = clip_rect(rect, self.width, self.height)
+            if rect is None:
+                continue
+            start = self.width - 1 - rect.right
+            end = self.width - 1 - rect.left
+            for page in xrange(rect.top // PAGE_HEIGHT, rect.bottom // PAGE_HEIGHT + 1):
+                if page in columns:
+                    columns[page] = (min(columns[page][0], start), max(columns[page][1], end))
+                else:
+                    columns[page] = (start, end)
+        return columns
+
+    def _changed_runs(self, pages, columns=None):
+        runs = []
+        if self._last_frame is None:
+            changed = numpy.ones(pages.shape, dtype=numpy.bool_)
+        else:
+            changed = pages != self._last_frame
+        for page in xrange(len(pages)):
+            if columns is not None and page not in columns:
+                continue
+            first, last = columns[page] if columns is not None else (0, pages.shape[1] - 1)
+            indices = numpy.flatnonzero(changed[page, first:last + 1]) + first
+            if not len(indices):
+                continue
+            breaks = numpy.flatnonzero(numpy.diff(indices) > self.__MIN_COLUMN_GAP) + 1
+            starts = numpy.concatenate((indices[:1], indices[breaks]))
+            ends = numpy.concatenate((indices[breaks - 1], indices[-1:]))
+            runs.extend(PageRun(page, int(start), int(end)) for start, end in zip(starts, ends))
+        return runs
+
+    def _display(self, frame, damage=None, traces=()):
+        # The frame is already in GDDRAM layout, so changed columns go to the bus as they are.
+        pages = frame.pages
+        if self._resend:
+            self._resend = False
+            self._last_frame = None
+        columns = None if damage is None or self._last_frame is None else self._damaged_columns(damage)
+        writes = []
+        for run in self._changed_runs(pages, columns):
+            command = (COLUMNADDR, run.start, run.end, PAGEADDR, run.page, run.page)
+            writes.append(BusWrite(command, pages[run.page, run.start:run.end + 1].tolist()))
+        self._last_frame = pages.copy()
+        self._send(writes, traces)
 
     @property
     def height(self):
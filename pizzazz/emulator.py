@@ -0,0 +1,119 @@
+from display import SSD1306, COLUMNADDR, PAGEADDR
+from framebuffer import PageFrameBuffer
+
+# Control bytes sent ahead of each I2C block write
+CONTROL_COMMAND = 0x00
+CONTROL_DATA = 0x40
+
+
+class FakeI2CBus(object):
+    """
+    Stands in for an SMBus, counting traffic the way it would appear on the wire.
+    """
+
+    # Largest payload a single SMBus block write carries
+    BLOCK_SIZE = 32
+
+    def __init__(self, port):
+        super(FakeI2CBus, self).__init__()
+        self.port = port
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.transactions = 0
+        self.commands = 0
+        self.data_bytes = 0
+        # Address byte, control byte and payload of every transaction
+        self.wire_bytes = 0
+
+    def write_block(self, address, control, payload):
+        if len(payload) > self.BLOCK_SIZE:
+            raise ValueError("Block writes carry at most {} bytes.".format(self.BLOCK_SIZE))
+        self.transactions += 1
+        self.wire_bytes += 2 + len(payload)
+        if control == CONTROL_COMMAND:
+            self.commands += 1
+        else:
+            self.data_bytes += len(payload)
+
+
+_buses = {}
+
+
+def get_fake_bus(port):
+    bus = _buses.get(port)
+    if bus is None:
+        bus = FakeI2CBus(port)
+        _buses[port] = bus
+    return bus
+
+
+class FakeSSD1306Device(object):
+    """
+    Implements the command() and data() calls of oled.device.ssd1306, writing into an in-memory GDDRAM in horizontal
+    addressing mode.
+    """
+
+    def __init__(self, port=1, address=0x3C, width=128, height=64):
+        super(FakeSSD1306Device, self).__init__()
+        self.width = width
+        self.height = height
+        self.pages = height // 8
+        self.address = address
+        self.bus = get_fake_bus(port)
+        self.gddram = [bytearray(width) for _ in xrange(self.pages)]
+        self._columns = (0, width - 1)
+        self._page_range = (0, self.pages - 1)
+        self._column = 0
+        self._page = 0
+
+    def command(self, *cmd):
+        self.bus.write_block(self.address, CONTROL_COMMAND, cmd)
+        i = 0
+        while i < len(cmd):
+            if cmd[i] == COLUMNADDR:
+                self._columns = (cmd[i + 1], cmd[i + 2])
+                self._column = cmd[i + 1]
+                i += 3
+            elif cmd[i] == PAGEADDR:
+                self._page_range = (cmd[i + 1], cmd[i + 2])
+                self._page = cmd[i + 1]
+                i += 3
+            else:
+                i += 1
+
+    def data(self, data):
+        for i in xrange(0, len(data), self.bus.BLOCK_SIZE):
+            self.bus.write_block(self.address, CONTROL_DATA, data[i:i + self.bus.BLOCK_SIZE])
+        for byte in data:
+            self.gddram[self._page][self._column] = byte
+            if self._column < self._columns[1]:
+                self._column += 1
+            else:
+                self._column = self._columns[0]
+                self._page = self._page + 1 if self._page < self._page_range[1] else self._page_range[0]
+
+    def to_frame(self):
+        return PageFrameBuffer.from_bytes(self.width, self.height, "".join(str(page) for page in self.gddram))
+
+    def to_image(self):
+        return self.to_frame().to_image()
+
+
+class EmulatedSSD1306(SSD1306):
+    """
+    An SSD1306 that draws into a FakeSSD1306Device, for profiling and testing rendering without hardware.
+    """
+
+    def _request_device(self):
+        return FakeSSD1306Device(port=self.port, address=self.address)
+
+    @property
+    def bus(self):
+        return self.device.bus
+
+    def to_image(self):
+        return self.device.to_image()
+
+    def save_frame(self, path):
+        self.to_image().save(path, "PNG")
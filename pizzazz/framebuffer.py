@@ -0,0 +1,162 @@
+import numpy
+from PIL import Image
+
+# Constants
+PAGE_HEIGHT = 8
+_BIT_WEIGHTS = 1 << numpy.arange(PAGE_HEIGHT)
+
+
+def pack_pages(pixels, shift=0):
+    """
+    Packs a boolean array of rows into page-major bytes, one byte per column with the top row in the least significant
+    bit, as if the first row sat shift rows into a page. Returns an array of (pages, columns).
+    """
+    height, width = pixels.shape
+    pages = (shift + height + PAGE_HEIGHT - 1) // PAGE_HEIGHT
+    rows = numpy.zeros((pages * PAGE_HEIGHT, width), dtype=numpy.bool_)
+    rows[shift:shift + height] = pixels
+    return numpy.tensordot(_BIT_WEIGHTS, rows.reshape(pages, PAGE_HEIGHT, width), axes=([0], [1])).astype(numpy.uint8)
+
+
+def _row_masks(top, bottom):
+    # Yields each page spanned by rows top to bottom inclusive, with the bits of those rows within it.
+    for page in xrange(top // PAGE_HEIGHT, bottom // PAGE_HEIGHT + 1):
+        first = max(top - page * PAGE_HEIGHT, 0)
+        last = min(bottom - page * PAGE_HEIGHT, PAGE_HEIGHT - 1)
+        yield page, (0xFF << first) & (0xFF >> (PAGE_HEIGHT - 1 - last))
+
+
+class PageFrameBuffer(object):
+    """
+    A 1-bit frame kept in the SSD1306's own GDDRAM layout: rows of 8 pixels packed into pages, one byte per column,
+    columns running right-to-left to match oled.device.ssd1306.display(). It can be sent to the display as it is.
+
+    It doubles as the canvas windows draw on, with the rectangle() and bitmap() calls of ImageDraw. Fills are solid
+    for any non-zero value.
+    """
+
+    def __init__(self, width, height, fill=0, pages=None):
+        super(PageFrameBuffer, self).__init__()
+        self._width = width
+        self._height = height
+        if pages is None:
+            pages = numpy.empty(((height + PAGE_HEIGHT - 1) // PAGE_HEIGHT, width), dtype=numpy.uint8)
+            pages.fill(0xFF if fill else 0)
+        self._pages = pages
+        # The same memory indexed by x from the left, which is what drawing works in.
+        self._columns = pages[:, ::-1]
+
+    @classmethod
+    def from_image(cls, image):
+        width, height = image.size
+        stride = (width + 7) // 8
+        packed = numpy.frombuffer(image.convert("1").tobytes(), dtype=numpy.uint8).reshape(height, stride)
+        pixels = numpy.unpackbits(packed, axis=1)[:, :width].astype(numpy.bool_)
+        return cls(width, height, pages=numpy.ascontiguousarray(pack_pages(pixels)[:, ::-1]))
+
+    @classmethod
+    def from_bytes(cls, width, height, data):
+        pages = numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, width).copy()
+        return cls(width, height, pages=pages)
+
+    @property
+    def width(self):
+        return self._width
+
+    @property
+    def height(self):
+        return self._height
+
+    @property
+    def size(self):
+        return self._width, self._height
+
+    @property
+    def pages(self):
+        """
+        The frame as a (pages, columns) uint8 array in GDDRAM order.
+        """
+        return self._pages
+
+    def copy(self):
+        return PageFrameBuffer(self._width, self._height, pages=self._pages.copy())
+
+    def tobytes(self):
+        return self._pages.tobytes()
+
+    def to_image(self):
+        bits = (self._columns[:, numpy.newaxis, :] >> numpy.arange(PAGE_HEIGHT)[:, numpy.newaxis]) & 1
+        pixels = bits.reshape(-1, self._width)[:self._height].astype(numpy.bool_)
+        return Image.frombytes("1", self.size, numpy.packbits(pixels, axis=1).tobytes())
+
+    def _clip(self, left, top, right, bottom):
+        left, top = max(int(left), 0), max(int(top), 0)
+        right, bottom = min(int(right), self._width - 1), min(int(bottom), self._height - 1)
+        if left > right or top > bottom:
+            return None
+        return left, top, right, bottom
+
+    def _fill(self, left, top, right, bottom, fill):
+        box = self._clip(left, top, right, bottom)
+        if box is None:
+            return
+        left, top, right, bottom = box
+        for page, mask in _row_masks(top, bottom):
+            target = self._columns[page, left:right + 1]
+            if fill:
+                target |= mask
+            else:
+                target &= ~mask & 0xFF
+
+    def rectangle(self, xy, fill=None, outline=None):
+        if len(xy) == 2:
+            (left, top), (right, bottom) = xy
+        else:
+            left, top, right, bottom = xy
+        if fill is not None:
+            self._fill(left, top, right, bottom, fill)
+        if outline is not None:
+            self._fill(left, top, right, top, outline)
+            self._fill(left, bottom, right, bottom, outline)
+            self._fill(left, top, left, bottom, outline)
+            self._fill(right, top, right, bottom, outline)
+
+    def bitmap(self, xy, bitmap, fill=None):
+        """
+        Draws the set pixels of a mask, either an image or a boolean array, with the fill.
+        """
+        if isinstance(bitmap, Image.Image):
+            bitmap = numpy.asarray(bitmap.convert("L")) > 0
+        x, y = xy
+        self.blit_pages((x, y), pack_pages(bitmap, y % PAGE_HEIGHT), fill)
+
+    def blit_pages(self, xy, packed, fill=None):
+        """
+        Draws a mask already packed with pack_pages() for the row offset y % 8, a byte per column at a time.
+        """
+        x, y = xy
+        first_page = y // PAGE_HEIGHT
+        pages, width = packed.shape
+        page_start, page_end = max(first_page, 0), min(first_page + pages, len(self._pages))
+        left, right = max(x, 0), min(x + width, self._width)
+        if page_start >= page_end or left >= right:
+            return
+        source = packed[page_start - first_page:page_end - first_page, left - x:right - x]
+        target = self._columns[page_start:page_end, left:right]
+        if fill:
+            target |= source
+        else:
+            target &= ~source
+
+    def paste(self, frame, rect):
+        """
+        Copies the pixels inside rect, inclusive, from another frame of the same size.
+        """
+        box = self._clip(*rect)
+        if box is None:
+            return
+        left, top, right, bottom = box
+        for page, mask in _row_masks(top, bottom):
+            target = self._columns[page, left:right + 1]
+            target &= ~mask & 0xFF
+            target |= frame._columns[page, left:right + 1] & mask
@@ -0,0 +1,404 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from collections import namedtuple, OrderedDict
+
+import numpy
+import PIL
+from PIL import Image, ImageDraw
+
+from framebuffer import PageFrameBuffer, pack_pages, PAGE_HEIGHT
+from stats import get_stats
+from utils import FontRegistry
+
+# Tuples
+# bitmap: the glyph's ink, cropped. left, top: where its top left pixel sits, right of the pen and above the baseline.
+# advance: how far the pen moves on. indent: where the pen starts when the glyph begins the text.
+# size_advance, overhang, lead, ascent, descent: the metrics ImageFont.getsize() adds up for the glyph, which come
+# from differently hinted outlines than the pixels and so do not always agree with them.
+Glyph = namedtuple("Glyph", "bitmap left top advance indent size_advance overhang lead ascent descent")
+# What glyphs are measured against: the text they are drawn after and where its ink ends, and REFERENCE_CHARACTER's
+# columns when drawn alone and its top row above the baseline.
+GlyphReference = namedtuple("GlyphReference", "prefix end left right top")
+
+# Constants
+PRINTABLE_ASCII = [chr(code) for code in xrange(32, 127)]
+# Glyphs are measured by where Pillow draws them next to this one.
+REFERENCE_CHARACTER = "H"
+GLYPH_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "pizzazz")
+
+##########
+# Glyph cache files hold the glyphs of one font file at one size that have been drawn so far. The layout is CACHE_HEADER, then a
+# CACHE_ENTRY per glyph, then the glyph bitmaps at the offsets the entries give, one byte per pixel, row by row.
+# Bitmaps are used straight out of the read-only mapping, so every process on the unit shares the same pages.
+##########
+
+CACHE_MAGIC = "PZGC"
+CACHE_VERSION = 2
+# magic, version, SHA-1 of the font file, Pillow version that rasterized it, font size, line height, ascent, glyph count
+CACHE_HEADER = struct.Struct("<4sH20s16sHHHI")
+# code point, the Glyph fields from left to descent, bitmap width, bitmap height, bitmap offset
+CACHE_ENTRY = struct.Struct("<I9hHHI")
+
+
+def font_hash(filename):
+    with open(filename, "rb") as font_file:
+        return hashlib.sha1(font_file.read()).digest()
+
+
+def glyph_cache_path(cache_dir, digest, size):
+    return os.path.join(cache_dir, "{}-{}.glyphs".format(digest.encode("hex"), size))
+
+
+def load_glyph_cache(path, digest, size):
+    """
+    Maps a glyph cache file read-only. Returns (line height, ascent, {character: Glyph}), or None if the file is
+    missing or was written for another font, size, format version or Pillow version.
+    """
+    try:
+        with open(path, "rb") as cache_file:
+            data = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError, ValueError):
+        return None
+    try:
+        magic, version, cached_digest, pillow_version, cached_size, height, ascent, count = \
+            CACHE_HEADER.unpack_from(data, 0)
+        if (magic, version, cached_digest, pillow_version.rstrip("\0"), cached_size) != \
+                (CACHE_MAGIC, CACHE_VERSION, digest, PIL.__version__, size):
+            return None
+        glyphs = {}
+        for i in xrange(count):
+            entry = CACHE_ENTRY.unpack_from(data, CACHE_HEADER.size + i * CACHE_ENTRY.size)
+            code, metrics, (width, rows, offset) = entry[0], entry[1:10], entry[10:]
+            if offset + width * rows > len(data):
+                return None
+            bitmap = numpy.frombuffer(data, dtype=numpy.bool_, count=width * rows, offset=offset)
+            glyphs[chr(code) if code < 128 else unichr(code)] = Glyph(bitmap.reshape(rows, width), *metrics)
+    except struct.error:
+        # Cut short, most likely by running out of disk while it was written.
+        return None
+    return height, ascent, glyphs
+
+
+def save_glyph_cache(path, digest, size, height, ascent, glyphs):
+    """
+    Writes the glyphs to a cache file, replacing any file at path in one step so readers never see half of it.
+    """
+    characters = sorted(glyphs)
+    offset = CACHE_HEADER.size + CACHE_ENTRY.size * len(characters)
+    entries = []
+    for character in characters:
+        glyph = glyphs[character]
+        rows, width = glyph.bitmap.shape
+        entries.append(CACHE_ENTRY.pack(ord(character), *(glyph[1:] + (width, rows, offset))))
+        offset += glyph.bitmap.size
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary, "wb") as cache_file:
+        cache_file.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, digest, PIL.__version__, size, height, ascent,
+                                           len(characters)))
+        cache_file.write("".join(entries))
+        for character in characters:
+            cache_file.write(numpy.ascontiguousarray(glyphs[character].bitmap, dtype=numpy.bool_).tobytes())
+    os.rename(temporary, path)
+
+
+class GlyphAtlas(object):
+    """
+    Rasterized glyphs of one font and size, laid out to the pixel as ImageDraw.text() lays them out on a 1-bit image.
+    Glyphs are rasterized the first time they are drawn, unless they are listed in characters up front.
+
+    Given a cache_dir, glyphs are loaded from a glyph cache file there, keyed by the font file's hash, so the font is
+    only opened for glyphs missing from it. Glyphs rasterized later are written back to the file by save(), which the
+    window manager calls after the first frame and then now and again, so the file fills in as the program draws
+    without a disk write on the render path for every new character.
+    """
+
+    __STRIP_CACHE_SIZE = 64
+    # Drawn after a glyph being measured, so that getsize() does not clip it.
+    __PADDING = "    "
+
+    def __init__(self, filename, size, characters=(), cache_dir=None):
+        super(GlyphAtlas, self).__init__()
+        self._filename = filename
+        self._size = size
+        self._font = None
+        self._glyphs = {}
+        self._reference = None
+        self._cache_path = None
+        self._digest = None
+        self._unsaved = False
+        self._strips = OrderedDict()
+        self._packed_strips = OrderedDict()
+        cached = None
+        if cache_dir is not None:
+            self._digest = font_hash(filename)
+            self._cache_path = glyph_cache_path(cache_dir, self._digest, size)
+            cached = load_glyph_cache(self._cache_path, self._digest, size)
+        if cached is not None:
+            get_stats().cache_hit("glyph_cache")
+            self._height, self._ascent, self._glyphs = cached
+        else:
+            if cache_dir is not None:
+                get_stats().cache_miss("glyph_cache")
+            ascent, descent = self.font.getmetrics()
+            self._height = ascent + descent
+            self._ascent = ascent
+        self._glyphs_for(characters)
+        self.save()
+
+    def save(self):
+        """
+        Writes the glyphs to the cache file if any were rasterized since it was loaded or last written.
+        """
+        if not self._unsaved:
+            return
+        self._unsaved = False
+        try:
+            save_glyph_cache(self._cache_path, self._digest, self._size, self._height, self._ascent, self._glyphs)
+        except (IOError, OSError):
+            # A read-only or full disk only means these glyphs are rasterized again next time.
+            pass
+
+    @property
+    def font(self):
+        if self._font is None:
+            self._font = FontRegistry().acquire(self._filename, self._size)
+        return self._font
+
+    @property
+    def filename(self):
+        return self._filename
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def height(self):
+        return self._height
+
+    ##########
+    # Pillow 6 sizes text with hinted outlines but draws it on 1-bit images with outlines hinted for monochrome, whose
+    # advances and heights can differ by a pixel. It draws into a box as big as getsize() says, clipping what falls
+    # outside, and stands every glyph on the deepest descender in the text. Glyphs are measured by drawing them after
+    # REFERENCE_CHARACTER and the tallest glyph, so that those choose the row the text stands on and none of the
+    # measured glyph is clipped.
+    ##########
+
+    def _ink(self, text):
+        # The pixels ImageDraw.text() sets for the text drawn at (margin, margin). Glyphs are measured a few at a time,
+        # and none is wider than two ems, so this always leaves room on every side.
+        margin = 2 * self._size
+        image = Image.new("1", (32 * self._size, 5 * self._size), 0)
+        ImageDraw.Draw(image).text((margin, margin), text, font=self.font, fill=255)
+        return numpy.asarray(image.convert("L"), dtype=numpy.uint8) > 0, margin
+
+    def _metrics(self, text):
+        # The box getsize() gives the text, before it is moved by the offset: (width, height, x offset, y offset).
+        (width, height), (x, y) = self.font.getsize(text), self.font.getoffset(text)
+        return width - x, height - y, x, y
+
+    def _pen_after(self, text):
+        # How far right of where the text starts a REFERENCE_CHARACTER drawn after it is put.
+        known, margin = self._ink(text + self.__PADDING)
+        added = self._ink(text + REFERENCE_CHARACTER + self.__PADDING)[0] & ~known
+        return int(numpy.flatnonzero(added.any(axis=0))[0]) - self._get_reference().left
+
+    def _get_reference(self):
+        if self._reference is None:
+            alone, margin = self._ink(REFERENCE_CHARACTER + self.__PADDING)
+            columns = numpy.flatnonzero(alone.any(axis=0))
+            rows = numpy.flatnonzero(alone.any(axis=1))
+            _, height, _, y = self._metrics(REFERENCE_CHARACTER)
+            tallest = min(PRINTABLE_ASCII, key=lambda character: self.font.getoffset(character)[1])
+            prefix = REFERENCE_CHARACTER + tallest + "  "
+            end = int(numpy.flatnonzero(self._ink(prefix)[0].any(axis=0))[-1]) + 1
+            self._reference = GlyphReference(prefix, end, int(columns[0]), int(columns[-1]) + 1,
+                                             height - (int(rows[0]) - margin - y))
+        return self._reference
+
+    def _rasterize(self, character):
+        reference = self._get_reference()
+        pen = self._pen_after(reference.prefix)
+        drawn, margin = self._ink(reference.prefix + character + self.__PADDING)
+        ink = drawn.copy()
+        ink[:, :reference.end] = False
+        rows = numpy.flatnonzero(ink.any(axis=1))
+        columns = numpy.flatnonzero(ink.any(axis=0))
+        _, height, x, y = self._metrics(character)
+        if len(columns):
+            bitmap = ink[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1]
+            left = int(columns[0]) - margin - pen
+            reference_row = numpy.flatnonzero(drawn[:, reference.left:reference.right].any(axis=1))[0]
+            top = reference.top - int(rows[0] - reference_row)
+            alone = self._ink(character + self.__PADDING)[0]
+            indent = int(numpy.flatnonzero(alone.any(axis=0))[0]) - margin - x - left
+        else:
+            bitmap = numpy.zeros((0, 0), dtype=numpy.bool_)
+            left = top = indent = 0
+        size_advance = self.font.getsize(REFERENCE_CHARACTER + character * 2)[0] - \
+            self.font.getsize(REFERENCE_CHARACTER + character)[0]
+        reference_advance = self.font.getsize(REFERENCE_CHARACTER * 2)[0] - self.font.getsize(REFERENCE_CHARACTER)[0]
+        overhang = self.font.getsize(REFERENCE_CHARACTER + character)[0] - reference_advance - size_advance
+        ascent = self._ascent - y
+        glyph = Glyph(bitmap, left, top, self._pen_after(reference.prefix + character) - pen, indent, size_advance,
+                      overhang, -x, ascent, ascent - height)
+        self._glyphs[character] = glyph
+        self._unsaved = self._cache_path is not None
+        return glyph
+
+    def glyph(self, character):
+        glyph = self._glyphs.get(character)
+        if glyph is None:
+            glyph = self._rasterize(character)
+        return glyph
+
+    def _glyphs_for(self, text):
+        return [self.glyph(character) for character in text]
+
+    @staticmethod
+    def _box_width(glyphs):
+        # The width getsize() works out before the offset, which is also how wide Pillow lets the ink reach.
+        pen = width = 0
+        for glyph in glyphs:
+            width = max(width, pen + glyph.size_advance + glyph.overhang)
+            pen += glyph.size_advance
+        return 2 * glyphs[0].lead + max(width, pen)
+
+    def _layout(self, glyphs):
+        """
+        Returns the box ImageDraw.text() clips the glyphs to as (left, top, right, bottom), exclusive of right and
+        bottom, and the top left corner of each glyph's bitmap, all relative to where the text is drawn.
+        """
+        ascent = max(glyph.ascent for glyph in glyphs)
+        descent = min(glyph.descent for glyph in glyphs)
+        deepest = max([0] + [glyph.bitmap.shape[0] - glyph.top for glyph in glyphs if glyph.bitmap.size])
+        left = -glyphs[0].lead
+        top = self._ascent - ascent
+        bottom = top + ascent - descent
+        baseline = bottom - deepest
+        pen = left + glyphs[0].indent
+        positions = []
+        for glyph in glyphs:
+            positions.append((pen + glyph.left, baseline - glyph.top))
+            pen += glyph.advance
+        return (left, top, left + self._box_width(glyphs), bottom), positions
+
+    def get_width(self, text):
+        """
+        Returns the width ImageFont.getsize() gives the text.
+        """
+        if not text:
+            return 0
+        glyphs = self._glyphs_for(text)
+        return self._box_width(glyphs) - glyphs[0].lead
+
+    def get_prefix_widths(self, text):
+        """
+        Returns a list where item i is how far the ink of text[:i] reaches, as drawn by draw_text(). Widths never
+        decrease, so the list can be bisected.
+        """
+        widths = [0]
+        if not text:
+            return widths
+        glyphs = self._glyphs_for(text)
+        (_, _, right, _), positions = self._layout(glyphs)
+        for glyph, (x, _) in zip(glyphs, positions):
+            reach = min(x + glyph.bitmap.shape[1], right) if glyph.bitmap.size else 0
+            widths.append(max(widths[-1], reach))
+        return widths
+
+    def _compose(self, text):
+        # Returns the top left corner of the text's clipping box, relative to where the text is drawn, and its pixels.
+        glyphs = self._glyphs_for(text)
+        (left, top, right, bottom), positions = self._layout(glyphs)
+        pixels = numpy.zeros((bottom - top, right - left), dtype=numpy.bool_)
+        for glyph, (x, y) in zip(glyphs, positions):
+            rows, columns = glyph.bitmap.shape
+            x0, y0 = max(x, left), max(y, top)
+            x1, y1 = min(x + columns, right), min(y + rows, bottom)
+            if x0 < x1 and y0 < y1:
+                pixels[y0 - top:y1 - top, x0 - left:x1 - left] |= glyph.bitmap[y0 - y:y1 - y, x0 - x:x1 - x]
+        return (left, top), pixels
+
+    def _cached(self, cache, name, key, build):
+        strip = cache.get(key)
+        if strip is not None:
+            get_stats().cache_hit(name)
+            del cache[key]
+            cache[key] = strip
+            return strip
+        get_stats().cache_miss(name)
+        strip = build()
+        cache[key] = strip
+        if len(cache) > self.__STRIP_CACHE_SIZE:
+            cache.popitem(last=False)
+        return strip
+
+    def _build_strip(self, text):
+        offset, pixels = self._compose(text)
+        return offset, Image.fromarray(pixels.astype(numpy.uint8) * 255, "L")
+
+    def render(self, text):
+        """
+        Composites the glyphs of the text into a single mask image, suitable for ImageDraw.bitmap(). Returns the mask
+        and where its top left corner goes, relative to where the text is drawn.
+        """
+        offset, strip = self._cached(self._strips, "glyph_strips", text, lambda: self._build_strip(text))
+        return strip, offset
+
+    def render_pages(self, text, y=0):
+        """
+        Composites the glyphs of the text, drawn at row y, into page-major bytes for PageFrameBuffer.blit_pages().
+        Returns the bytes and where they go, relative to where the text is drawn.
+        """
+        def build():
+            (left, top), pixels = self._compose(text)
+            return (left, top), pack_pages(pixels, (y + top) % PAGE_HEIGHT)
+
+        offset, packed = self._cached(self._packed_strips, "glyph_pages", (text, y % PAGE_HEIGHT), build)
+        return packed, offset
+
+    def draw_text(self, canvas, xy, text, fill):
+        if not text:
+            return
+        x, y = xy
+        if isinstance(canvas, PageFrameBuffer):
+            packed, (left, top) = self.render_pages(text, y)
+            canvas.blit_pages((x + left, y + top), packed, fill)
+        else:
+            strip, (left, top) = self.render(text)
+            canvas.bitmap((x + left, y + top), strip, fill=fill)
+
+
+_atlases = {}
+_atlases_lock = threading.Lock()
+
+
+def get_atlas(filename, size):
+    """
+    Returns the atlas shared by everything drawing with this font and size, backed by a glyph cache file in
+    GLYPH_CACHE_DIR unless that is set to None.
+    """
+    key = (os.path.abspath(filename), size)
+    with _atlases_lock:
+        atlas = _atlases.get(key)
+        if atlas is None:
+            atlas = GlyphAtlas(key[0], size, cache_dir=GLYPH_CACHE_DIR)
+            _atlases[key] = atlas
+        return atlas
+
+
+def save_atlases():
+    """
+    Writes back the glyphs every shared atlas rasterized since its cache file was last written.
+    """
+    with _atlases_lock:
+        atlases = list(_atlases.values())
+    for atlas in atlases:
+        atlas.save()
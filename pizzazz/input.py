@@ -1,13 +1,11 @@
-import time
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 
-from gpiozero import Button
-
-from utils import Singleton
+from utils import Singleton, monotonic_ns
 
 # Tuples
 ButtonEvent = namedtuple("ButtonEvent", "pin name action timestamp")
 NamedButton = namedtuple("NamedButton", "name button pin")
+ButtonSpec = namedtuple("ButtonSpec", "pin name pull_up bounce_time hold_time hold_repeat")
 PinnedCallbacks = namedtuple("PinnedCallbacks", "pin callbacks")
 ButtonCallbacks = namedtuple("ButtonCallbacks", "pressed released held")
 
@@ -25,6 +23,8 @@ class ButtonManager(object):
         super(ButtonManager, self).__init__()
         self._button_controller = None
         self._button_map = {}
+        self._pending = OrderedDict()
+        self._started = False
 
     @property
     def button_controller(self):
@@ -34,9 +34,30 @@ class ButtonManager(object):
     def button_controller(self, value):
         self._button_controller = value
 
+    @property
+    def started(self):
+        return self._started
+
     def add_button(self, pin, name, pull_up=True, bounce_time=None, hold_time=None, hold_repeat=None):
-        if self._button_map.has_key(pin):
+        """
+        Buttons added before start() are only set up on the GPIO pins when it is called.
+        """
+        if self._button_map.has_key(pin) or pin in self._pending:
             return
+        spec = ButtonSpec(pin, name, pull_up, bounce_time, hold_time, hold_repeat)
+        if self._started:
+            self._create_button(spec)
+        else:
+            self._pending[pin] = spec
+
+    def start(self):
+        self._started = True
+        while self._pending:
+            self._create_button(self._pending.popitem(last=False)[1])
+
+    def _create_button(self, spec):
+        from gpiozero import Button
+        pin, name, pull_up, bounce_time, hold_time, hold_repeat = spec
         # TODO: Reference http://stackoverflow.com/a/21986301/1846662 for a better way to call Button()
         if bounce_time > 0:
             button = Button(pin, pull_up, bounce_time)
@@ -56,7 +77,7 @@ class ButtonManager(object):
 
     def _create_event(self, pin, action):
         button = self._get_button(pin)
-        timestamp = int(time.time())
+        timestamp = monotonic_ns()
         return ButtonEvent(pin, button.name, action, timestamp)
 
     def _handle_event(self, pin, action):
@@ -78,3 +99,5 @@ class ButtonManager(object):
             named_button.button.close()
             del named_button
         self._button_map.clear()
+        self._pending.clear()
+        self._started = False
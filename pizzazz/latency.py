@@ -0,0 +1,165 @@
+import sys
+import threading
+from collections import OrderedDict
+
+from utils import Singleton, monotonic_ns
+
+# Marks, in the order an input event passes through them
+MARK_PRESSED = "pressed"
+MARK_DISPATCHED = "dispatched"
+MARK_CHANGED = "changed"
+MARK_RASTER_START = "raster_start"
+MARK_RASTER_END = "raster_end"
+MARK_TRANSFER_START = "transfer_start"
+MARK_TRANSFER_END = "transfer_end"
+
+# Stages, each the span between two marks
+STAGES = OrderedDict([
+    ("input", (MARK_PRESSED, MARK_DISPATCHED)),
+    ("handler", (MARK_DISPATCHED, MARK_CHANGED)),
+    ("schedule", (MARK_CHANGED, MARK_RASTER_START)),
+    ("raster", (MARK_RASTER_START, MARK_RASTER_END)),
+    ("bus_queue", (MARK_RASTER_END, MARK_TRANSFER_START)),
+    ("transfer", (MARK_TRANSFER_START, MARK_TRANSFER_END)),
+    ("total", (MARK_PRESSED, MARK_TRANSFER_END)),
+])
+
+# Marks that move forward when a trace spans several screens, so the stage ends when the last screen is done.
+_LATEST_MARKS = (MARK_RASTER_END, MARK_TRANSFER_END)
+
+
+class Histogram(object):
+
+    # Bucket i counts samples below 2^i nanoseconds; 2^40ns is about 18 minutes.
+    BUCKETS = 41
+
+    def __init__(self):
+        super(Histogram, self).__init__()
+        self._buckets = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self._buckets[min(max(value, 0).bit_length(), self.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def percentile(self, percent):
+        """
+        Returns the upper bound of the bucket holding the given percentile, clamped to the largest sample seen.
+        """
+        if not self.count:
+            return 0
+        threshold = self.count * percent / 100.0
+        seen = 0
+        for i in xrange(self.BUCKETS):
+            seen += self._buckets[i]
+            if seen >= threshold:
+                return min(1 << i, self.max)
+        return self.max
+
+
+class LatencyTrace(object):
+
+    def __init__(self, pressed_ns):
+        super(LatencyTrace, self).__init__()
+        self.marks = {MARK_PRESSED: pressed_ns}
+        self._outstanding = 0
+
+    def mark(self, name, ns=None):
+        if ns is None:
+            ns = monotonic_ns()
+        if name in _LATEST_MARKS or name not in self.marks:
+            self.marks[name] = ns
+
+    def durations(self):
+        durations = {}
+        for stage, (start, end) in STAGES.items():
+            if start in self.marks and end in self.marks:
+                durations[stage] = self.marks[end] - self.marks[start]
+        return durations
+
+
+class LatencyTracer(object):
+    """
+    Follows input events from the gpiozero callback to the end of the I2C write that shows their effect.
+    """
+
+    __metaclass__ = Singleton
+
+    def __init__(self):
+        super(LatencyTracer, self).__init__()
+        self.enabled = True
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._histograms = OrderedDict((stage, Histogram()) for stage in STAGES)
+
+    @property
+    def active(self):
+        return getattr(self._local, "trace", None)
+
+    def begin(self, event):
+        if not self.enabled:
+            return None
+        trace = LatencyTrace(event.timestamp)
+        trace.mark(MARK_DISPATCHED)
+        self._local.trace = trace
+        return trace
+
+    def end(self):
+        self._local.trace = None
+
+    def attach(self, traces):
+        """
+        Adds the active trace, if any, to a window's set of traces waiting on its next frame.
+        """
+        trace = self.active
+        if trace is not None and trace not in traces:
+            trace.mark(MARK_CHANGED)
+            with self._lock:
+                trace._outstanding += 1
+            traces.append(trace)
+
+    @staticmethod
+    def mark(traces, name):
+        if traces:
+            ns = monotonic_ns()
+            for trace in traces:
+                trace.mark(name, ns)
+
+    def complete(self, traces):
+        for trace in traces:
+            with self._lock:
+                trace._outstanding -= 1
+                if trace._outstanding > 0:
+                    continue
+                for stage, duration in trace.durations().items():
+                    self._histograms[stage].add(duration)
+
+    def histogram(self, stage):
+        return self._histograms[stage]
+
+    @property
+    def histograms(self):
+        return self._histograms
+
+    def reset(self):
+        with self._lock:
+            for stage in self._histograms:
+                self._histograms[stage] = Histogram()
+
+    def dump(self, stream=sys.stdout):
+        stream.write("{:<10} {:>7} {:>10} {:>10} {:>10} {:>10}\n".format("stage", "count", "mean ms", "p50 ms",
+                                                                         "p99 ms", "max ms"))
+        for stage, histogram in self._histograms.items():
+            stream.write("{:<10} {:>7} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}\n".format(
+                stage, histogram.count, histogram.mean / 1e6, histogram.percentile(50) / 1e6,
+                histogram.percentile(99) / 1e6, (histogram.max or 0) / 1e6))
@@ -0,0 +1,133 @@
+from framebuffer import PageFrameBuffer, PAGE_HEIGHT
+from render import Rect, clip_rect, intersects
+from stats import get_stats
+from utils import not_implemented
+
+
+class AbstractLayer(object):
+    """
+    A part of a window that rarely changes, such as a title bar, border or icon. It is drawn once into a
+    PageFrameBuffer and kept as the pages it spans, which are combined into the window's frame with bitwise operations
+    until the layer is invalidated. Within its rect a layer is opaque, covering whatever the window drew there.
+    """
+
+    def __init__(self):
+        super(AbstractLayer, self).__init__()
+        self._size = None
+        self._rect = None
+        self._pages = None
+        self._bits = None
+        self._keep = None
+
+    def get_rect(self, screen):
+        raise NotImplementedError(not_implemented(self, "get_rect()"))
+
+    def draw(self, screen, canvas):
+        raise NotImplementedError(not_implemented(self, "draw()"))
+
+    def invalidate(self):
+        """
+        Drops the cached bitmap so the layer is drawn again the next time it is composited. The window must also be
+        invalidated over the layer's rect for the change to reach the screen.
+        """
+        self._bits = None
+
+    @property
+    def valid(self):
+        return self._bits is not None
+
+    def _pack(self, screen):
+        rect = clip_rect(self.get_rect(screen), screen.width, screen.height)
+        self._size = (screen.width, screen.height)
+        self._rect = rect
+        if rect is None:
+            self._bits = ()
+            return
+        frame = PageFrameBuffer(screen.width, screen.height, screen.fill_empty)
+        self.draw(screen, frame)
+        mask = PageFrameBuffer(screen.width, screen.height)
+        mask.rectangle(rect, fill=screen.fill_solid)
+        self._pages = slice(rect.top // PAGE_HEIGHT, rect.bottom // PAGE_HEIGHT + 1)
+        mask = mask.pages[self._pages]
+        self._bits = frame.pages[self._pages] & mask
+        self._keep = ~mask
+
+    def needs_composite(self, screen, damage=None):
+        if damage is None or not self.valid or self._size != (screen.width, screen.height):
+            return True
+        return self._rect is not None and any(intersects(self._rect, rect) for rect in damage)
+
+    def composite(self, screen, frame):
+        """
+        Combines the layer into a PageFrameBuffer in place.
+        """
+        if not self.valid or self._size != (screen.width, screen.height):
+            get_stats().cache_miss("layers")
+            self._pack(screen)
+        else:
+            get_stats().cache_hit("layers")
+        if self._rect is None:
+            return
+        pages = frame.pages[self._pages]
+        pages &= self._keep
+        pages |= self._bits
+
+
+def composite_layers(screen, frame, layers, damage=None):
+    """
+    Combines the layers into the frame in place. Given the damage rects of a partial redraw, layers that do not
+    intersect them are already in the frame and are skipped.
+    """
+    for layer in layers:
+        if layer.needs_composite(screen, damage):
+            layer.composite(screen, frame)
+
+
+class TitleBarLayer(AbstractLayer):
+
+    def __init__(self, window):
+        super(TitleBarLayer, self).__init__()
+        self._window = window
+
+    def get_rect(self, screen):
+        return self._window._title_rect(screen.width)
+
+    def draw(self, screen, canvas):
+        self._window._draw_title(screen, canvas)
+
+
+class TitleBarMixin(object):
+    """
+    Reserves the top SCREEN_TOP pixels of a window for its title. The title bar is a cached layer, so it is only drawn
+    again when the title changes, and draw() can leave that area alone.
+    """
+
+    # The top 16 rows of a two-color SSD1306 panel are yellow.
+    SCREEN_TOP = 16
+    TITLE_PADDING_LEFT = 2
+
+    def __init__(self, *args, **kwargs):
+        super(TitleBarMixin, self).__init__(*args, **kwargs)
+        self._title_layer = TitleBarLayer(self)
+        self.add_layer(self._title_layer)
+
+    def _title_rect(self, width):
+        return Rect(0, 0, width - 1, self.SCREEN_TOP - 1)
+
+    def _draw_title(self, screen, canvas):
+        """
+        Override this method to change how the title bar looks. It is drawn once per change, not once per frame, into a
+        PageFrameBuffer: use its rectangle() and bitmap(), and self._draw_text() for text. ImageDraw calls such as
+        text() are not available on it.
+        """
+        self._draw_text(canvas, (self.TITLE_PADDING_LEFT, 0), self.title, screen.fill_solid)
+
+    def invalidate_title(self):
+        self._title_layer.invalidate()
+        if self.screen is not None:
+            self.invalidate(self._title_rect(self.screen.width))
+        else:
+            self.invalidate()
+
+    def _when_title_changed(self):
+        self.invalidate_title()
@@ -0,0 +1,101 @@
+import heapq
+import itertools
+import threading
+import time
+from Queue import Queue, Empty
+
+
+class Timer(object):
+
+    def __init__(self, when, callback, args, interval=None):
+        super(Timer, self).__init__()
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.interval = interval
+        self._cancelled = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        self._cancelled = True
+
+
+class EventLoop(object):
+
+    # Longest the loop blocks at once, so that KeyboardInterrupt is still delivered to the main thread.
+    __MAX_WAIT = 1.0
+
+    def __init__(self):
+        super(EventLoop, self).__init__()
+        self._ready = Queue()
+        self._timers = []
+        self._timers_lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._running = False
+
+    @property
+    def running(self):
+        return self._running
+
+    def call_soon(self, callback, *args):
+        """
+        Runs the callback on the loop's thread. Safe to call from any thread, including gpiozero callbacks.
+        """
+        self._ready.put((callback, args))
+
+    def call_later(self, delay, callback, *args):
+        return self._add_timer(Timer(time.time() + delay, callback, args))
+
+    def call_every(self, interval, callback, *args):
+        """
+        Runs the callback every interval seconds until the returned Timer is cancelled.
+        """
+        return self._add_timer(Timer(time.time() + interval, callback, args, interval))
+
+    def _add_timer(self, timer):
+        with self._timers_lock:
+            heapq.heappush(self._timers, (timer.when, next(self._sequence), timer))
+        # Wake the loop in case this timer is due before the one it is waiting on.
+        self.call_soon(lambda: None)
+        return timer
+
+    def _next_timeout(self):
+        with self._timers_lock:
+            if not self._timers:
+                return self.__MAX_WAIT
+            return min(max(self._timers[0][0] - time.time(), 0), self.__MAX_WAIT)
+
+    def _run_timers(self):
+        now = time.time()
+        due = []
+        with self._timers_lock:
+            while self._timers and self._timers[0][0] <= now:
+                due.append(heapq.heappop(self._timers)[2])
+        for timer in due:
+            if timer.cancelled:
+                continue
+            timer.callback(*timer.args)
+            if timer.interval is not None and not timer.cancelled:
+                timer.when += timer.interval
+                if timer.when < now:
+                    timer.when = now + timer.interval
+                self._add_timer(timer)
+
+    def run_forever(self):
+        self._running = True
+        while self._running:
+            try:
+                callback, args = self._ready.get(timeout=self._next_timeout())
+                callback(*args)
+            except Empty:
+                pass
+            self._run_timers()
+
+    def stop(self):
+        self.call_soon(self._stop)
+
+    def _stop(self):
+        self._running = False
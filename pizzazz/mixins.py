@@ -1,7 +1,3 @@
-from gpiozero import GPIOPinInUse
-from gpiozero import LED
-from gpiozero import PWMLED
-
 from input import ButtonCallbacks, ButtonManager, PinnedCallbacks, ACTION_PRESSED, ACTION_RELEASED, ACTION_HELD
 from utils import not_implemented
 
@@ -10,27 +6,28 @@ class AbstractButtonControllerMixin(object):
 
     def __init__(self):
         self._button_map = {}
+        self._dispatch_table = {}
         self._setup_buttons()
 
+    @property
+    def dispatch_table(self):
+        """
+        Maps (button name, action) to the callback handling it. Callbacks return True to consume the event.
+        """
+        return self._dispatch_table
+
     def _handle_button_event(self, event):
-        if self._button_map.has_key(event.name):
-            btn = self._button_map[event.name]
-            callbacks = btn.callbacks
-            callback = None
-            if event.action == ACTION_PRESSED:
-                callback = callbacks.pressed
-            elif event.action == ACTION_RELEASED:
-                callback = callbacks.released
-            elif event.action == ACTION_HELD:
-                callback = callbacks.held
-            if callback is not None:
-                callback()
+        callback = self._dispatch_table.get((event.name, event.action))
+        if callback is not None:
+            return callback() is True
+        return False
 
     def _setup_buttons(self):
         raise NotImplementedError(not_implemented(self, "_setup_buttons()"))
 
     def _setup_button(self, name, pin, pressed_callback=None, released_callback=None, held_callback=None):
         if self._button_map.has_key(name) and self._button_map[name] is not None:
+            from gpiozero import GPIOPinInUse
             raise GPIOPinInUse("Button {} has already been set up on pin {}.".format(name, self._button_map[name].pin))
         elif type(pin) is not int:
             raise TypeError("Value for pin must be an integer.")
@@ -40,6 +37,10 @@ class AbstractButtonControllerMixin(object):
             button_callbacks = ButtonCallbacks(pressed_callback, released_callback, held_callback)
             pinned_callback = PinnedCallbacks(pin, button_callbacks)
             self._button_map[name] = pinned_callback
+            for action, callback in ((ACTION_PRESSED, pressed_callback), (ACTION_RELEASED, released_callback),
+                                     (ACTION_HELD, held_callback)):
+                if callback is not None:
+                    self._dispatch_table[(name, action)] = callback
 
 
 class MultiButtonControllerMixin(AbstractButtonControllerMixin):
@@ -49,19 +50,35 @@ class MultiButtonControllerMixin(AbstractButtonControllerMixin):
     def __init__(self):
         super(MultiButtonControllerMixin, self).__init__()
         self._button_controllers = []
+        # (button name, action) -> [(controller, callback)], in the same order as _button_controllers
+        self._dispatch_index = {}
 
     def register_controller(self, button_controller, front_of_queue=False):
         if front_of_queue is True:
             self._button_controllers.insert(0, button_controller)
         else:
             self._button_controllers.append(button_controller)
+        for key, callback in button_controller.dispatch_table.iteritems():
+            handlers = self._dispatch_index.setdefault(key, [])
+            if front_of_queue is True:
+                handlers.insert(0, (button_controller, callback))
+            else:
+                handlers.append((button_controller, callback))
 
     def unregister_controller(self, button_controller):
         self._button_controllers.remove(button_controller)
+        for key in button_controller.dispatch_table:
+            handlers = [handler for handler in self._dispatch_index[key] if handler[0] is not button_controller]
+            if handlers:
+                self._dispatch_index[key] = handlers
+            else:
+                del self._dispatch_index[key]
 
     def _handle_button_event(self, event):
-        for controller in self._button_controllers:
-            controller._handle_button_event(event)
+        for controller, callback in self._dispatch_index.get((event.name, event.action), ()):
+            if callback() is True:
+                return True
+        return False
 
     def _setup_buttons(self):
         pass
@@ -214,6 +231,7 @@ class LEDControllerMixin(object):
         self._led = self._create_led(pin)
 
     def _create_led(self, pin):
+        from gpiozero import LED
         return LED(pin)
 
     def setup_on_pin(self, pin, name=None, reassign=False):
@@ -253,6 +271,7 @@ class LEDControllerMixin(object):
 class PWMLEDControllerMixin(LEDControllerMixin):
 
     def _create_led(self, pin):
+        from gpiozero import PWMLED
         return PWMLED(pin)
 
     def blink(self, on_time=1, off_time=1, fade_in_time=0, fade_out_time=0, n=None, background=True):
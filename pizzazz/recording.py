@@ -0,0 +1,297 @@
+import mmap
+import os
+import struct
+import threading
+from collections import namedtuple
+
+import numpy
+from PIL import Image
+
+from framebuffer import PageFrameBuffer, PAGE_HEIGHT
+from utils import monotonic_ns
+
+##########
+# File layout: the header, then records appended one after another. Every record starts with RECORD_HEADER:
+#   type, screen id, monotonic timestamp in ns, payload length
+# SCREEN records declare a screen id as "<HH" width and height followed by the screen's name. DELTA records hold
+# the XOR of a screen's frame, in SSD1306 page layout, against its previous frame; KEYFRAME records hold it against a blank
+# frame. Both are run-length encoded as pairs of varints (unchanged bytes to skip, changed bytes that follow),
+# each pair followed by the changed bytes. Version 1 files hold frames as PIL "1" mode rows instead.
+##########
+
+# Tuples
+RecordIndex = namedtuple("RecordIndex", "offset type screen timestamp length")
+ScreenInfo = namedtuple("ScreenInfo", "name width height")
+RecordedFrame = namedtuple("RecordedFrame", "screen timestamp image")
+
+# Constants
+MAGIC = "PZFR"
+VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+FILE_HEADER = struct.Struct("<4sH")
+RECORD_HEADER = struct.Struct("<cBQI")
+SCREEN_SIZE = struct.Struct("<HH")
+RECORD_SCREEN = "S"
+RECORD_DELTA = "D"
+RECORD_KEYFRAME = "K"
+
+
+def _write_varint(buf, value):
+    while value >= 0x80:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = ord(data[offset])
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def encode_delta(delta):
+    """
+    Run-length encodes a uint8 array that is mostly zero. Gaps of a couple of bytes are folded into the literal run,
+    since a new pair would cost as much.
+    """
+    encoded = bytearray()
+    changed = numpy.flatnonzero(delta)
+    if not len(changed):
+        return encoded
+    breaks = numpy.flatnonzero(numpy.diff(changed) > 2) + 1
+    starts = changed[numpy.r_[0, breaks]]
+    ends = changed[numpy.r_[breaks - 1, len(changed) - 1]] + 1
+    position = 0
+    for start, end in zip(starts, ends):
+        _write_varint(encoded, int(start) - position)
+        _write_varint(encoded, int(end - start))
+        encoded.extend(delta[start:end].tobytes())
+        position = int(end)
+    return encoded
+
+
+def apply_delta(frame, data, offset, length):
+    """
+    XORs an encoded delta from data[offset:offset + length] into the frame array in place.
+    """
+    end = offset + length
+    position = 0
+    while offset < end:
+        skip, offset = _read_varint(data, offset)
+        count, offset = _read_varint(data, offset)
+        position += skip
+        literal = numpy.frombuffer(data[offset:offset + count], dtype=numpy.uint8)
+        frame[position:position + count] ^= literal
+        position += count
+        offset += count
+
+
+def _whole_records_length(recording, path):
+    """
+    Returns how many bytes at the start of an open recording are the file header and whole records, so anything a
+    crash cut short after them can be truncated before appending. Raises ValueError if the file is not a recording of
+    the current version, as frames of another version would be decoded wrongly.
+    """
+    recording.seek(0, os.SEEK_END)
+    size = recording.tell()
+    if size < FILE_HEADER.size:
+        return 0
+    recording.seek(0)
+    magic, version = FILE_HEADER.unpack(recording.read(FILE_HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("{} is not a frame recording.".format(path))
+    if version != VERSION:
+        raise ValueError("{} is a version {} recording; record version {} frames to a new file.".format(
+            path, version, VERSION))
+    offset = FILE_HEADER.size
+    while offset + RECORD_HEADER.size <= size:
+        recording.seek(offset)
+        length = RECORD_HEADER.unpack(recording.read(RECORD_HEADER.size))[3]
+        if offset + RECORD_HEADER.size + length > size:
+            break
+        offset += RECORD_HEADER.size + length
+    return offset
+
+
+class FrameRecorder(object):
+    """
+    Appends every frame it is given to a recording. An existing recording of the same version is carried on from its
+    last whole record, dropping whatever a crash left half written.
+    """
+
+    # A keyframe every so many frames per screen lets replay seek without decoding from the start.
+    KEYFRAME_INTERVAL = 256
+    # Frames are handed to the OS at least this often, so a crash loses little more than the frame being written.
+    FLUSH_FRAMES = 32
+    FLUSH_INTERVAL_NS = 1000000000
+
+    def __init__(self, path):
+        super(FrameRecorder, self).__init__()
+        self._path = path
+        self._lock = threading.Lock()
+        self._screens = {}
+        self._previous = {}
+        self._since_keyframe = {}
+        self._unflushed = 0
+        self._flushed_at = monotonic_ns()
+        self._file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        try:
+            end = _whole_records_length(self._file, path)
+        except ValueError:
+            self._file.close()
+            raise
+        self._file.truncate(end)
+        self._file.seek(end)
+        if end == 0:
+            self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+
+    @property
+    def path(self):
+        return self._path
+
+    def _write_record(self, record_type, screen_id, payload):
+        timestamp = monotonic_ns()
+        self._file.write(RECORD_HEADER.pack(record_type, screen_id, timestamp, len(payload)))
+        self._file.write(payload)
+        return timestamp
+
+    def _screen_id(self, screen):
+        screen_id = self._screens.get(screen)
+        if screen_id is None:
+            screen_id = len(self._screens)
+            self._screens[screen] = screen_id
+            payload = SCREEN_SIZE.pack(screen.width, screen.height) + screen.name.encode("utf-8")
+            self._write_record(RECORD_SCREEN, screen_id, payload)
+        return screen_id
+
+    def record(self, screen, frame):
+        frame = numpy.frombuffer(frame.tobytes(), dtype=numpy.uint8)
+        with self._lock:
+            if self._file is None:
+                return
+            screen_id = self._screen_id(screen)
+            previous = self._previous.get(screen_id)
+            since_keyframe = self._since_keyframe.get(screen_id, self.KEYFRAME_INTERVAL)
+            if previous is None or since_keyframe >= self.KEYFRAME_INTERVAL:
+                timestamp = self._write_record(RECORD_KEYFRAME, screen_id, encode_delta(frame))
+                self._since_keyframe[screen_id] = 1
+            else:
+                timestamp = self._write_record(RECORD_DELTA, screen_id, encode_delta(frame ^ previous))
+                self._since_keyframe[screen_id] = since_keyframe + 1
+            self._previous[screen_id] = frame
+            self._unflushed += 1
+            if self._unflushed >= self.FLUSH_FRAMES or timestamp - self._flushed_at >= self.FLUSH_INTERVAL_NS:
+                self._flush()
+
+    def _flush(self):
+        self._file.flush()
+        self._unflushed = 0
+        self._flushed_at = monotonic_ns()
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class FrameReplay(object):
+    """
+    Steps through a recording memory-mapped read-only, decoding only the frames asked for.
+    """
+
+    def __init__(self, path):
+        super(FrameReplay, self).__init__()
+        self._file = open(path, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = FILE_HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC:
+            raise ValueError("{} is not a frame recording.".format(path))
+        if version not in SUPPORTED_VERSIONS:
+            raise ValueError("Unsupported recording version {}.".format(version))
+        self._version = version
+        self.screens = {}
+        self._frames = []
+        self._index()
+        self._cursor = {}
+
+    def _index(self):
+        # Each session appended to the file numbers its screens from 0 again, so the ids in the file only mean something
+        # up to the next declaration. Screens are keyed here by what they are, which stays the same across sessions.
+        keys = {}
+        offset = FILE_HEADER.size
+        while offset + RECORD_HEADER.size <= len(self._data):
+            record_type, screen_id, timestamp, length = RECORD_HEADER.unpack_from(self._data, offset)
+            offset += RECORD_HEADER.size
+            if offset + length > len(self._data):
+                # A record cut short by the recording process stopping mid-write.
+                break
+            if record_type == RECORD_SCREEN:
+                width, height = SCREEN_SIZE.unpack_from(self._data, offset)
+                name = self._data[offset + SCREEN_SIZE.size:offset + length].decode("utf-8")
+                info = ScreenInfo(name, width, height)
+                key = next((key for key, known in self.screens.items() if known == info), len(self.screens))
+                self.screens[key] = info
+                keys[screen_id] = key
+            elif screen_id in keys:
+                self._frames.append(RecordIndex(offset, record_type, keys[screen_id], timestamp, length))
+            offset += length
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __iter__(self):
+        for i in xrange(len(self._frames)):
+            yield self.frame(i)
+
+    def record(self, i):
+        return self._frames[i]
+
+    def _blank(self, screen_id):
+        info = self.screens[screen_id]
+        if self._version == 1:
+            return numpy.zeros((info.width + 7) // 8 * info.height, dtype=numpy.uint8)
+        return numpy.zeros((info.height + PAGE_HEIGHT - 1) // PAGE_HEIGHT * info.width, dtype=numpy.uint8)
+
+    def frame(self, i):
+        """
+        Returns the i-th frame as a RecordedFrame. Stepping forward one frame at a time decodes a single delta.
+        """
+        record = self._frames[i]
+        cursor = self._cursor.get(record.screen)
+        if record.type == RECORD_KEYFRAME or cursor is None or cursor[0] >= i:
+            # Walk back to the closest keyframe for this screen and decode forward from it.
+            start = i
+            while self._frames[start].type != RECORD_KEYFRAME or self._frames[start].screen != record.screen:
+                start -= 1
+            pixels = self._blank(record.screen)
+        else:
+            start, pixels = cursor[0] + 1, cursor[1].copy()
+        for j in xrange(start, i + 1):
+            step = self._frames[j]
+            if step.screen != record.screen:
+                continue
+            if step.type == RECORD_KEYFRAME:
+                pixels = self._blank(record.screen)
+            apply_delta(pixels, self._data, step.offset, step.length)
+        self._cursor[record.screen] = (i, pixels)
+        info = self.screens[record.screen]
+        if self._version == 1:
+            image = Image.frombytes("1", (info.width, info.height), pixels.tobytes())
+        else:
+            image = PageFrameBuffer.from_bytes(info.width, info.height, pixels.tobytes()).to_image()
+        return RecordedFrame(info.name, record.timestamp, image)
+
+    def close(self):
+        self._data.close()
+        self._file.close()
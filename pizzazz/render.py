@@ -1,16 +1,30 @@
 import re
-from collections import namedtuple
+from bisect import bisect_right
+from collections import namedtuple, OrderedDict
 from types import NoneType
 
-from PIL import ImageFont
-
-from utils import TextAlignment, not_implemented, is_iterable, midpoint
+from glyphs import get_atlas
+from stats import get_stats
+from utils import TextAlignment, not_implemented, is_iterable
 
 # TODO: Screens should use the renderers as the method for drawing window contents
 
 Rect = namedtuple("Rect", "left top right bottom",)
 Point = namedtuple("Point", "x y")
 Range = namedtuple("Range", "start end")
+TextLine = namedtuple("TextLine", "y segments")
+TextSegment = namedtuple("TextSegment", "x text")
+
+
+def intersects(a, b):
+    return a.left <= b.right and b.left <= a.right and a.top <= b.bottom and b.top <= a.bottom
+
+
+def clip_rect(rect, width, height):
+    clipped = Rect(max(rect.left, 0), max(rect.top, 0), min(rect.right, width - 1), min(rect.bottom, height - 1))
+    if clipped.left > clipped.right or clipped.top > clipped.bottom:
+        return None
+    return clipped
 
 
 class AbstractRenderer(object):
@@ -18,24 +32,24 @@ class AbstractRenderer(object):
     def __init__(self):
         super(AbstractRenderer, self).__init__()
 
-    def render(self):
+    def render(self, canvas, rect, fill):
         raise NotImplementedError(not_implemented(self, "render()"))
 
 
 class TextRenderer(AbstractRenderer):
 
+    __LAYOUT_CACHE_SIZE = 32
+    # Shared by every renderer, keyed by (text, font, size, width, alignment).
+    _layouts = OrderedDict()
+
     def __init__(self):
         super(TextRenderer, self).__init__()
-        self._font = None
+        self._atlas = None
         self._font_filename = None
         self._font_size = 10
         self._alignment = TextAlignment.LEFT
         self._text = ""
 
-    @staticmethod
-    def _create_font(filename, size):
-        return ImageFont.truetype(filename, size)
-
     def _init_font(self, filename=None, size=None):
         changed = False
         if filename is None:
@@ -48,8 +62,10 @@ class TextRenderer(AbstractRenderer):
         elif size != self._font_size:
             self._font_size = size
             changed = True
-        if self._font is None or changed is True:
-            self._font = self._create_font(filename, size)
+        if self._atlas is None or changed is True:
+            # Text is measured with the atlas it is drawn with, so layout matches the pixels exactly. The atlas opens
+            # the font itself if it has glyphs to rasterize.
+            self._atlas = get_atlas(filename, size)
 
     @property
     def font(self):
@@ -98,9 +114,11 @@ class TextRenderer(AbstractRenderer):
     def text(self, value):
         self._text = value
 
+    def _get_width(self, text):
+        return self._atlas.get_prefix_widths(text)[-1]
+
     def _text_fits(self, text, width):
-        size = self._font.getsize(text)
-        return size[0] <= width
+        return self._get_width(text) <= width
 
     def _split_lines(self, text):
         regex = re.compile(r"[\n\r]")
@@ -124,64 +142,96 @@ class TextRenderer(AbstractRenderer):
         else:
             return None
 
-    # TODO: Merge code from wordwrap.py in with these methods
-    # def _word_wrap(self, text, width):
-    #     # TODO: Try some math-based algorithm for detecting wrap-breaks.
-    #     # if line does not fit, check if half of the line fits.
-    #     # if half-line does not fit, check half-way between half-line and beginning.
-    #     # if half-line does fit, check halfway between half-line and end.
-    #     # Bounce back and forth before finding the max-length of text that fits. \
-    #     lines = []
-    #     processing = True
-    #     while processing:
-    #         pos = len(text)
-    #         fit = failure = None
-    #         line_complete = False
-    #         while not line_complete:
-    #             substr = text[:pos]
-    #             if self._text_fits(substr, width):
-    #                 # TODO: Add in code that considers closest whitespace position
-    #                 fit = pos
-    #                 if failure is None: # if pos == len:
-    #                     lines.append(substr)
-    #                     processing = False
-    #                     break
-    #                 high, low = (fit, failure) if fit >= failure else failure, fit
-    #                 pos = int()
-    #                 if pos > len(text):
-    #                     pass
-    #                 try:
-    #                     excess = text[pos]
-    #                     lines.extend(self._word_wrap(excess, width))
-    #                 except IndexError:
-    #                     # Do nothing here because excess went out of bounds so nothing is left.
-    #                     pass
-    #                 processing = True
-    #             else:
-    #                 failure = pos
-    #                 #todo adjust position
-    #             # new position
-    #             pos = midpoint(fit, failure)
-    #
-    #     return lines
-    #
-    # def _get_wrap_lines(self, text, width):
-    #     lines = self._split_lines(text)
-    #     wrapped_lines = []
-    #     for line in lines:
-    #         word_breaks = self._find_word_breaks(line)
-    #         word_breaks.reverse()
-    #         if self._text_fits(line, width):
-    #             wrapped_lines.append(line)
-    #             break
-    #         for word_break in word_breaks:
-    #             substr = line[:word_break.start]
-    #             if self._text_fits(substr, width):
-    #                 wrapped_lines.append(substr)
-    #                 excess = line[word_break.end:]
-    #                 wrapped_lines.append(self._get_wrap_lines(excess, width))
-    #                 # todo: push the excess to be the next item processed...
-    #     return lines
+    def _word_wrap(self, text, width):
+        lines = []
+        while text:
+            widths = self._atlas.get_prefix_widths(text)
+            if widths[-1] <= width:
+                lines.append(text)
+                break
+            # Bisect the cumulative widths for the longest prefix that fits, then back off to the last word break.
+            fit = bisect_right(widths, width) - 1
+            word_break = None
+            for break_ in self._find_word_breaks(text):
+                if break_.start > fit:
+                    break
+                if break_.start > 0:
+                    word_break = break_
+            if word_break is not None:
+                lines.append(text[:word_break.start])
+                text = text[word_break.end:]
+            else:
+                fit = max(fit, 1)
+                lines.append(text[:fit])
+                text = text[fit:].lstrip()
+        return lines
+
+    def _get_wrap_lines(self, text, width):
+        wrapped_lines = []
+        for line in self._split_lines(text):
+            wrapped = self._word_wrap(line, width)
+            if not wrapped:
+                wrapped = [""]
+            for i in xrange(len(wrapped)):
+                wrapped_lines.append((wrapped[i], i == len(wrapped) - 1))
+        return wrapped_lines
+
+    def _justify(self, line, width):
+        words = line.split()
+        if len(words) < 2:
+            return (TextSegment(0, line),)
+        gaps = len(words) - 1
+        spare = width - sum(self._get_width(word) for word in words)
+        segments = []
+        x = 0
+        for i in xrange(len(words)):
+            segments.append(TextSegment(x, words[i]))
+            if i < gaps:
+                x += self._get_width(words[i]) + spare // gaps + (1 if i < spare % gaps else 0)
+        return tuple(segments)
+
+    def _align(self, line, width, last_line):
+        line_width = self._get_width(line)
+        if self._alignment == TextAlignment.RIGHT:
+            return (TextSegment(width - line_width, line),)
+        elif self._alignment == TextAlignment.CENTER:
+            return (TextSegment((width - line_width) // 2, line),)
+        elif self._alignment == TextAlignment.JUSTIFY and not last_line:
+            return self._justify(line, width)
+        else:
+            return (TextSegment(0, line),)
+
+    def layout(self, width):
+        """
+        Returns the wrapped and aligned lines of the text for the given width. Layouts are cached, so laying out the
+        same text again is a dictionary lookup.
+        """
+        key = (self._text, self._font_filename, self._font_size, width, self._alignment)
+        layout = self._layouts.get(key)
+        if layout is not None:
+            get_stats().cache_hit("layouts")
+            del self._layouts[key]
+        else:
+            get_stats().cache_miss("layouts")
+            line_height = self._atlas.height
+            lines = []
+            y = 0
+            for line, last_line in self._get_wrap_lines(self._text, width):
+                lines.append(TextLine(y, self._align(line, width, last_line)))
+                y += line_height
+            layout = tuple(lines)
+            if len(self._layouts) >= self.__LAYOUT_CACHE_SIZE:
+                self._layouts.popitem(last=False)
+        self._layouts[key] = layout
+        return layout
+
+    def render(self, canvas, rect, fill):
+        for line in self.layout(rect.right - rect.left + 1):
+            # Only whole lines are drawn; a line cut off at the bottom would spill out of the rect.
+            if rect.top + line.y + self._atlas.height - 1 > rect.bottom:
+                break
+            for segment in line.segments:
+                self._atlas.draw_text(canvas, (rect.left + segment.x, rect.top + line.y), segment.text, fill)
 
 
 class ListRenderer(AbstractRenderer):
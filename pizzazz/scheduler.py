@@ -0,0 +1,173 @@
+import logging
+import threading
+import time
+
+from loop import Timer
+from stats import get_stats
+
+logger = logging.getLogger(__name__)
+
+class FrameScheduler(object):
+
+    DEFAULT_FPS = 30
+
+    def __init__(self, fps=DEFAULT_FPS):
+        super(FrameScheduler, self).__init__()
+        self._interval = None
+        self.fps = fps
+        self._lock = threading.RLock()
+        self._pending = {}
+        self._requested = threading.Event()
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+        self._event_loop = None
+        self._flush_timer = None
+        self._animations = []
+        self._animation_timer = None
+        self._last_flush = 0
+
+    @property
+    def fps(self):
+        return 1.0 / self._interval
+
+    @fps.setter
+    def fps(self, value):
+        if value <= 0:
+            raise ValueError("FPS must be greater than zero.")
+        self._interval = 1.0 / value
+
+    @property
+    def lock(self):
+        """
+        Held while frames are flushed. Hold it while changing window state from other threads.
+        """
+        return self._lock
+
+    @property
+    def running(self):
+        return self._running
+
+    @property
+    def event_loop(self):
+        return self._event_loop
+
+    def attach(self, event_loop):
+        """
+        Schedules flushes as timers on the event loop instead of on the scheduler's own thread.
+        """
+        self._event_loop = event_loop
+        self._schedule_loop_animations()
+
+    def animate(self, interval, callback, *args):
+        """
+        Calls the callback every interval seconds with the lock held, for windows that change on their own. Returns a
+        Timer; cancel it to stop.
+        """
+        timer = Timer(time.time() + interval, callback, args, interval)
+        with self._lock:
+            self._animations.append(timer)
+        if self._event_loop is not None:
+            self._event_loop.call_soon(self._schedule_loop_animations)
+        else:
+            self._wake.set()
+        return timer
+
+    def _next_animation_delay(self):
+        with self._lock:
+            self._animations = [timer for timer in self._animations if not timer.cancelled]
+            if not self._animations:
+                return None
+            return max(min(timer.when for timer in self._animations) - time.time(), 0)
+
+    def _run_animations(self):
+        now = time.time()
+        with self._lock:
+            for timer in list(self._animations):
+                if timer.cancelled or timer.when > now:
+                    continue
+                try:
+                    timer.callback(*timer.args)
+                except Exception:
+                    # One broken animation must not stop the others or the frames behind them.
+                    logger.exception("Animation %r failed.", timer.callback)
+                timer.when += timer.interval
+                if timer.when < now:
+                    timer.when = now + timer.interval
+
+    def _schedule_loop_animations(self):
+        if self._animation_timer is not None:
+            self._animation_timer.cancel()
+            self._animation_timer = None
+        delay = self._next_animation_delay()
+        if delay is not None:
+            self._animation_timer = self._event_loop.call_later(delay, self._loop_animate)
+
+    def _loop_animate(self):
+        self._animation_timer = None
+        self._run_animations()
+        self._schedule_loop_animations()
+
+    def request(self, window):
+        """
+        Queues the window to be redrawn on the next tick. Only the latest window requested for each screen is drawn.
+        """
+        if window.screen is None:
+            return
+        with self._lock:
+            if window.screen in self._pending:
+                get_stats().frame_skipped(window.screen.name)
+            self._pending[window.screen] = window
+            if self._event_loop is None:
+                self._requested.set()
+                self._wake.set()
+            elif self._flush_timer is None:
+                delay = max(self._last_flush + self._interval - time.time(), 0)
+                self._flush_timer = self._event_loop.call_later(delay, self._loop_flush)
+
+    def flush(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._requested.clear()
+            for window in pending.values():
+                try:
+                    window.redraw()
+                except Exception:
+                    logger.exception("Drawing %s failed.", window.title)
+        self._last_flush = time.time()
+
+    def _loop_flush(self):
+        self._flush_timer = None
+        self.flush()
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="FrameScheduler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while self._running:
+            self._wake.wait(self._next_animation_delay())
+            self._wake.clear()
+            if not self._running:
+                break
+            self._run_animations()
+            if not self._requested.is_set():
+                continue
+            # Requests arriving while we wait out the rest of the tick are folded into this frame.
+            delay = self._last_flush + self._interval - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self.flush()
@@ -0,0 +1,86 @@
+import os
+import sys
+import threading
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+
+from utils import Singleton, monotonic_ns
+
+# Tuples
+StartupPhase = namedtuple("StartupPhase", "name start end")
+
+
+def _process_start_ns():
+    """
+    When the process was started, on the monotonic_ns() clock, read from /proc with clock tick resolution. Returns None
+    where /proc is not available.
+    """
+    try:
+        with open("/proc/uptime") as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        with open("/proc/self/stat") as stat_file:
+            # The command name can contain spaces, so fields are counted from the end of it.
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+        started = int(fields[19]) / float(os.sysconf("SC_CLK_TCK"))
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+    return monotonic_ns() - int((uptime - started) * 1e9)
+
+
+class StartupProfile(object):
+    """
+    Times the phases of starting up, measured from when the process started, up to the first frame on each screen.
+    """
+
+    __metaclass__ = Singleton
+
+    def __init__(self):
+        super(StartupProfile, self).__init__()
+        self._origin = _process_start_ns()
+        self._origin_is_process = self._origin is not None
+        if self._origin is None:
+            self._origin = monotonic_ns()
+        self._lock = threading.Lock()
+        self._phases = []
+        self._first_frames = OrderedDict()
+
+    @contextmanager
+    def phase(self, name):
+        start = monotonic_ns()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._phases.append(StartupPhase(name, start, monotonic_ns()))
+
+    def frame_sent(self, screen_name):
+        if screen_name not in self._first_frames:
+            with self._lock:
+                self._first_frames.setdefault(screen_name, monotonic_ns())
+
+    @property
+    def phases(self):
+        return list(self._phases)
+
+    @property
+    def first_frames(self):
+        return OrderedDict(self._first_frames)
+
+    def time_to_first_frame(self):
+        """
+        Nanoseconds from the start of the process until every screen had a frame sent, or None until then.
+        """
+        if not self._first_frames:
+            return None
+        return max(self._first_frames.values()) - self._origin
+
+    def dump(self, stream=sys.stdout):
+        origin = "process start" if self._origin_is_process else "first import"
+        stream.write("{:<24} {:>10} {:>10}\n".format("startup phase", "at ms", "took ms"))
+        for phase in sorted(self._phases, key=lambda phase: phase.start):
+            stream.write("{:<24} {:>10.1f} {:>10.1f}\n".format(phase.name, (phase.start - self._origin) / 1e6,
+                                                               (phase.end - phase.start) / 1e6))
+        for screen_name, ns in self._first_frames.items():
+            stream.write("{:<24} {:>10.1f}\n".format("first frame " + screen_name, (ns - self._origin) / 1e6))
+        if self.time_to_first_frame() is not None:
+            stream.write("Time to first frame: {:.1f}ms since {}\n".format(self.time_to_first_frame() / 1e6, origin))
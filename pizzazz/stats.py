@@ -0,0 +1,100 @@
+import threading
+from collections import OrderedDict
+
+
+class Timing(object):
+
+    def __init__(self):
+        super(Timing, self).__init__()
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.last = 0
+
+    def add(self, ns):
+        self.count += 1
+        self.total += ns
+        self.max = max(self.max, ns)
+        self.last = ns
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def as_dict(self):
+        return {"count": self.count, "mean_ms": self.mean / 1e6, "max_ms": self.max / 1e6, "last_ms": self.last / 1e6}
+
+
+class RenderStats(object):
+    """
+    Counters for the rendering hot path. Updates are cheap enough to leave on in production.
+    """
+
+    def __init__(self):
+        super(RenderStats, self).__init__()
+        self.enabled = True
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.frames_rendered = OrderedDict()
+        self.frames_skipped = OrderedDict()
+        self.draw_times = OrderedDict()
+        self.transfer_times = OrderedDict()
+        self.bus_bytes = OrderedDict()
+        self.cache_hits = OrderedDict()
+        self.cache_misses = OrderedDict()
+
+    @staticmethod
+    def _increment(counters, key, amount=1):
+        counters[key] = counters.get(key, 0) + amount
+
+    def frame_rendered(self, screen):
+        if self.enabled:
+            with self._lock:
+                self._increment(self.frames_rendered, screen)
+
+    def frame_skipped(self, screen):
+        if self.enabled:
+            with self._lock:
+                self._increment(self.frames_skipped, screen)
+
+    def window_drawn(self, window, ns):
+        if self.enabled:
+            with self._lock:
+                self.draw_times.setdefault(window, Timing()).add(ns)
+
+    def transferred(self, screen, port, byte_count, ns):
+        if self.enabled:
+            with self._lock:
+                self.transfer_times.setdefault(screen, Timing()).add(ns)
+                self._increment(self.bus_bytes, port, byte_count)
+
+    def cache_hit(self, cache):
+        if self.enabled:
+            with self._lock:
+                self._increment(self.cache_hits, cache)
+
+    def cache_miss(self, cache):
+        if self.enabled:
+            with self._lock:
+                self._increment(self.cache_misses, cache)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "frames_rendered": dict(self.frames_rendered),
+                "frames_skipped": dict(self.frames_skipped),
+                "draw_times": dict((key, timing.as_dict()) for key, timing in self.draw_times.items()),
+                "transfer_times": dict((key, timing.as_dict()) for key, timing in self.transfer_times.items()),
+                "bus_bytes": dict(self.bus_bytes),
+                "cache_hits": dict(self.cache_hits),
+                "cache_misses": dict(self.cache_misses),
+            }
+
+
+_stats = RenderStats()
+
+
+def get_stats():
+    return _stats
@@ -1,13 +1,22 @@
+import itertools
 import os
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from signal import pause
 
-from PIL import ImageFont
-
+from datasource import ListMenuDataSource, CachedMenuDataSource
+from display import get_bus_worker
+from glyphs import get_atlas, save_atlases
 from input import ButtonManager
+from layers import TitleBarMixin, composite_layers
+from render import Rect, intersects
+from recording import FrameRecorder
+from scheduler import FrameScheduler
+from startup import StartupProfile
+from stats import get_stats
+from latency import LatencyTracer
 from mixins import MultiButtonControllerMixin, OkCancelButtonControllerMixin, DPadButtonControllerMixin, \
     AlertLEDControllerMixin, LEDControllerMixin
-from utils import not_implemented, is_iterable
+from utils import FontRegistry, not_implemented, is_iterable
 
 
 MenuItem = namedtuple("MenuItem", "title callback")
@@ -16,64 +25,403 @@ DEFAULT_FONT_PATH = "./fonts/Super-Mario-World.ttf"
 DEFAULT_FONT_SIZE = 8
 
 
+class FrameCache(object):
+    """
+    Keeps the last rendered frames of windows that are not on screen, so they can be shown again without drawing them.
+    Past its size the least recently used window is told to release its frame.
+    """
+
+    DEFAULT_SIZE = 16
+
+    def __init__(self, size=DEFAULT_SIZE):
+        super(FrameCache, self).__init__()
+        self._size = size
+        self._windows = OrderedDict()
+
+    @property
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._windows)
+
+    def __contains__(self, window):
+        return window in self._windows
+
+    def store(self, window):
+        self._windows.pop(window, None)
+        if window.frame is None:
+            return
+        self._windows[window] = True
+        while len(self._windows) > self._size:
+            evicted, _ = self._windows.popitem(last=False)
+            evicted.release_frame()
+
+    def take(self, window):
+        """
+        Returns the window's cached frame and stops tracking it, or None when it was never stored or was evicted.
+        """
+        if self._windows.pop(window, None) is None or window.frame is None:
+            get_stats().cache_miss("window_frames")
+            return None
+        get_stats().cache_hit("window_frames")
+        return window.frame
+
+    def discard(self, window):
+        self._windows.pop(window, None)
+
+
+class WindowStack(object):
+    """
+    The windows opened on one screen of a WindowManager, the top one shown. Windows reach the stack they are on
+    through AbstractWindow.stack.
+    """
+
+    def __init__(self, window_manager, name):
+        super(WindowStack, self).__init__()
+        self._window_manager = window_manager
+        self._name = name
+        self._windows = []
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def top(self):
+        return self._windows[-1] if self._windows else None
+
+    def __len__(self):
+        return len(self._windows)
+
+    def __iter__(self):
+        return iter(list(self._windows))
+
+    def push(self, window):
+        self._window_manager.push_window(self._name, window)
+
+    def pop(self):
+        return self._window_manager.pop_window(self._name)
+
+
+class ScreenSlot(object):
+    """
+    A screen registered with a WindowManager: where it sits in the layout and the stack of windows opened on it.
+    """
+
+    def __init__(self, name, screen, column, row, stack):
+        super(ScreenSlot, self).__init__()
+        self.name = name
+        self.screen = screen
+        self.column = column
+        self.row = row
+        self.stack = stack
+
+    @property
+    def window(self):
+        return self.stack.top
+
+
 class WindowManager(MultiButtonControllerMixin):
 
-    # TODO: Dual screen functionality to be moved to optional subclass
-    # TODO: Window history/backstack
+    # How often glyphs rasterized since start-up are written back to the glyph cache files, in seconds.
+    GLYPH_CACHE_SAVE_INTERVAL = 30.0
 
-    def __init__(self, left_screen, right_screen):
+    def __init__(self, fps=FrameScheduler.DEFAULT_FPS, frame_cache_size=FrameCache.DEFAULT_SIZE):
         super(WindowManager, self).__init__()
-        self._alert_led = AlertLEDControllerMixin(13, "red")
-        self._screensaver_led = LEDControllerMixin(19, "green")
+        self._scheduler = FrameScheduler(fps)
+        self._event_loop = None
+        self._stats_timer = None
+        self._glyph_cache_timer = None
+        self._recorder = None
+        self._running = False
+        # LEDs and buttons are set up on their pins by start(), once the first frame is on its way.
+        self._alert_led = AlertLEDControllerMixin()
+        self._screensaver_led = LEDControllerMixin()
         self._btn_mgr = ButtonManager()
         self._btn_mgr.button_controller = self
-        self._left_screen = left_screen
-        self._right_screen = right_screen
-        self._focused_screen = None
-        self._left_window = None
-        self._right_window = None
+        self._slots = OrderedDict()
+        self._focused_slot = None
         self._focused_window = None
+        self._frame_cache = FrameCache(frame_cache_size)
         self.register_controller(WindowManager.ButtonController(self))
 
+    def add_screen(self, screen, column=None, row=0, name=None):
+        """
+        Registers a screen at a position in the layout, a grid of columns and rows that focus moves through. Screens
+        can be on any I2C port; each port gets its own bus worker. Returns the screen's name, which defaults to
+        screen.name.
+        """
+        if name is None:
+            name = screen.name
+        if name in self._slots:
+            raise ValueError("A screen named {} has already been added.".format(name))
+        if column is None:
+            column = max([slot.column for slot in self._slots.values() if slot.row == row] or [-1]) + 1
+        self._slots[name] = ScreenSlot(name, screen, column, row, WindowStack(self, name))
+        # Screens added later get what the ones already running have.
+        screen.recorder = self._recorder
+        if self._stats_timer is not None:
+            screen.overlay = self._draw_stats_overlay
+        if self._running:
+            worker = get_bus_worker(screen.port)
+            screen.worker = worker
+            worker.start()
+        return name
+
+    def remove_screen(self, name):
+        slot = self._slots.pop(name)
+        while len(slot.stack):
+            self._discard(slot.stack._windows.pop())
+        if slot is self._focused_slot:
+            self._focused_slot = None
+            if self._slots:
+                self.focus_screen(self._slots.keys()[0])
+        slot.screen.clear_screen()
+
     @property
-    def left_window(self):
-        return self._left_window
+    def screens(self):
+        return OrderedDict((name, slot.screen) for name, slot in self._slots.items())
 
-    @left_window.setter
-    def left_window(self, value):
-        self._left_window = value
-        self._left_window.screen = self._left_screen
-        if self._focused_screen is None:
-            self._focus_screen(self._left_screen)
+    def get_screen(self, name):
+        return self._slots[name].screen
 
     @property
-    def right_window(self):
-        return self._right_window
+    def layout(self):
+        return OrderedDict((name, (slot.column, slot.row)) for name, slot in self._slots.items())
 
-    @right_window.setter
-    def right_window(self, value):
-        self._right_window = value
-        self._right_window.screen = self._right_screen
-        if self._focused_screen is None:
-            self._focus_screen(self._right_screen)
+    def get_window(self, name):
+        return self._slots[name].window
 
-    def focus_left(self):
-        self._focus_screen(self._left_screen)
+    def get_stack(self, name):
+        return self._slots[name].stack
 
-    def focus_right(self):
-        self._focus_screen(self._right_screen)
+    @property
+    def frame_cache(self):
+        return self._frame_cache
+
+    def set_window(self, name, window):
+        """
+        Shows the window on the named screen as the bottom of its stack, closing every window opened there before.
+        """
+        slot = self._slots[name]
+        if list(slot.stack) == [window]:
+            window.refresh()
+            return
+        while len(slot.stack):
+            self._discard(slot.stack._windows.pop())
+        self._open(slot, window)
+
+    def push_window(self, name, window):
+        """
+        Opens the window on top of the named screen's stack. The window it covers keeps its state and, while the frame
+        cache has room, its frame.
+        """
+        slot = self._slots[name]
+        covered = slot.window
+        if covered is window:
+            return
+        if covered is not None:
+            self._hide(covered)
+            self._frame_cache.store(covered)
+        self._open(slot, window)
+
+    def pop_window(self, name):
+        """
+        Closes the top window of the named screen's stack and shows the one under it again, straight from its cached
+        frame if it has one while it redraws. The bottom window is never popped. Returns the closed window or None.
+        """
+        slot = self._slots[name]
+        if len(slot.stack) < 2:
+            return None
+        window = slot.stack._windows.pop()
+        self._close(window)
+        # Kept while the cache has room, so opening the same window again is just as quick.
+        self._frame_cache.store(window)
+        self._show(slot, slot.window)
+        return window
+
+    def _open(self, slot, window):
+        slot.stack._windows.append(window)
+        window.stack = slot.stack
+        window._when_opened()
+        self._show(slot, window)
+
+    def _show(self, slot, window):
+        frame = self._frame_cache.take(window)
+        window.scheduler = self._scheduler
+        window.screen = slot.screen
+        if frame is not None and frame.size == (slot.screen.width, slot.screen.height):
+            slot.screen.draw_frame(frame)
+            # The cached frame goes out now; the window is still drawn again in case it changed while hidden, and
+            # only the bytes that differ follow it to the screen.
+            window.invalidate()
+        if self._focused_slot is None:
+            self.focus_screen(slot.name)
+        elif self._focused_slot is slot:
+            self._focus_window(window)
+        window.refresh()
+
+    def _hide(self, window):
+        if window is self._focused_window:
+            self._focus_window(None)
+        window.screen = None
+        window.drop_traces()
+        # Off the scheduler, windows stop their animations until they are shown again.
+        window.scheduler = None
+
+    def _close(self, window):
+        self._hide(window)
+        window.stack = None
+        window._when_closed()
+
+    def _discard(self, window):
+        # Closed for good, so nothing may keep its frame alive.
+        self._close(window)
+        self._frame_cache.discard(window)
+        window.release_frame()
+
+    @property
+    def focused_screen(self):
+        return self._focused_slot.name if self._focused_slot is not None else None
+
+    def _slot_for_screen(self, screen):
+        for slot in self._slots.values():
+            if slot.screen is screen:
+                return slot
+        return None
+
+    @property
+    def scheduler(self):
+        return self._scheduler
 
-    def _focus_screen(self, screen):
-        if self._focused_screen is screen:
+    @property
+    def event_loop(self):
+        return self._event_loop
+
+    @property
+    def latency(self):
+        return LatencyTracer()
+
+    @property
+    def startup(self):
+        return StartupProfile()
+
+    @property
+    def stats(self):
+        """
+        Rendering counters: frames rendered and skipped per screen, draw time per window, transfer time per screen,
+        bytes written per bus and cache hits and misses. Use stats.snapshot() for a plain dict.
+        """
+        return get_stats()
+
+    def start_recording(self, path):
+        """
+        Appends every frame sent to any screen to the file at path, for replaying later with replay.py.
+        """
+        self.stop_recording()
+        self._recorder = FrameRecorder(path)
+        for slot in self._slots.values():
+            slot.screen.recorder = self._recorder
+
+    def stop_recording(self):
+        if self._recorder is None:
             return
-        self._focused_screen = screen
-        if screen is self._left_screen:
-            self._focus_window(self._left_window)
-        elif screen is self._right_screen:
-            self._focus_window(self._right_window)
+        for slot in self._slots.values():
+            slot.screen.recorder = None
+        self._recorder.close()
+        self._recorder = None
+
+    def show_stats_overlay(self, enabled=True, interval=1.0):
+        """
+        Draws each screen's frame counts and its window's last draw time in the bottom right corner.
+        """
+        if self._stats_timer is not None:
+            self._stats_timer.cancel()
+            self._stats_timer = None
+        for slot in self._slots.values():
+            slot.screen.overlay = self._draw_stats_overlay if enabled else None
+        if enabled:
+            self._stats_timer = self._scheduler.animate(interval, self._present_windows)
+        self._present_windows()
+
+    def _present_windows(self):
+        with self._scheduler.lock:
+            for slot in self._slots.values():
+                if slot.window is not None:
+                    slot.screen.draw_window(slot.window)
+
+    def _draw_stats_overlay(self, screen, canvas):
+        stats = get_stats()
+        slot = self._slot_for_screen(screen)
+        window = slot.window if slot is not None else None
+        draw_time = stats.draw_times.get(window.name) if window is not None else None
+        # Microseconds, since the default font has no glyph for a decimal point.
+        text = "{}f {}s {}us".format(stats.frames_rendered.get(screen.name, 0),
+                                     stats.frames_skipped.get(screen.name, 0),
+                                     draw_time.last // 1000 if draw_time is not None else 0)
+        atlas = get_atlas(DEFAULT_FONT_PATH, DEFAULT_FONT_SIZE)
+        left = screen.width - atlas.get_width(text) - 1
+        top = screen.height - atlas.height - 1
+        canvas.rectangle((left - 1, top - 1, screen.width - 1, screen.height - 1), fill=screen.fill_empty)
+        atlas.draw_text(canvas, (left, top), text, screen.fill_solid)
+
+    def _handle_button_event(self, event):
+        if self._event_loop is not None:
+            self._event_loop.call_soon(self._dispatch_button_event, event)
         else:
-            # TODO: Raise exception since we're not expecting this screen
-            pass
+            self._dispatch_button_event(event)
+
+    def _dispatch_button_event(self, event):
+        with self._scheduler.lock:
+            LatencyTracer().begin(event)
+            try:
+                super(WindowManager, self)._handle_button_event(event)
+            finally:
+                LatencyTracer().end()
+
+    def focus_screen(self, name):
+        slot = self._slots.get(name)
+        if slot is None:
+            raise KeyError("No screen named {} has been added.".format(name))
+        if self._focused_slot is slot:
+            return
+        self._focused_slot = slot
+        self._focus_window(slot.window)
+
+    def focus_left(self):
+        return self._focus_towards(-1, 0)
+
+    def focus_right(self):
+        return self._focus_towards(1, 0)
+
+    def focus_up(self):
+        return self._focus_towards(0, -1)
+
+    def focus_down(self):
+        return self._focus_towards(0, 1)
+
+    def _focus_towards(self, columns, rows):
+        """
+        Moves focus to the nearest screen in the given direction, preferring screens in line with the focused one.
+        Returns False when there is none.
+        """
+        current = self._focused_slot
+        if current is None:
+            return False
+        best = None
+        for order, slot in enumerate(self._slots.values()):
+            along = (slot.column - current.column) * columns + (slot.row - current.row) * rows
+            if slot is current or along <= 0:
+                continue
+            across = abs(slot.row - current.row) if columns else abs(slot.column - current.column)
+            key = (along + across, across, order)
+            if best is None or key < best[0]:
+                best = (key, slot)
+        if best is None:
+            return False
+        self.focus_screen(best[1].name)
+        return True
 
     def _focus_window(self, window=None):
         if self._focused_window is not None:
@@ -85,16 +433,40 @@ class WindowManager(MultiButtonControllerMixin):
             self.register_controller(self._focused_window)
 
     def draw(self):
-        if self._left_window is not None:
-            self._left_window.refresh()
-        if self.right_window is not None:
-            self.right_window.refresh()
-
-    def start(self):
+        for slot in self._slots.values():
+            if slot.window is not None:
+                slot.window.refresh()
+
+    def start(self, event_loop=None):
+        """
+        Runs until interrupted. Given an EventLoop, button events and frame flushes run as callbacks on it, on this
+        thread, rather than on gpiozero and scheduler threads.
+
+        The first frame is rasterized and handed to the bus workers before the buttons and LEDs are set up, so the
+        screens light up while the rest of start-up finishes. A report of how long each phase took is printed.
+        """
         try:
+            startup = StartupProfile()
+            self._running = True
+            self._start_bus_workers()
+            with startup.phase("first frame"):
+                self.draw()
+                self._scheduler.flush()
+            with startup.phase("buttons and leds"):
+                self._start_hardware()
+            self._drain_bus_workers()
+            with startup.phase("glyph caches"):
+                save_atlases()
+            self._glyph_cache_timer = self._scheduler.animate(self.GLYPH_CACHE_SAVE_INTERVAL, save_atlases)
+            startup.dump()
             print "Main program loop started"
-            self.draw()
-            pause()
+            if event_loop is None:
+                self._scheduler.start()
+                pause()
+            else:
+                self._event_loop = event_loop
+                self._scheduler.attach(event_loop)
+                event_loop.run_forever()
         except KeyboardInterrupt:
             print("Program stopped.")
         else:
@@ -102,39 +474,143 @@ class WindowManager(MultiButtonControllerMixin):
         finally:
             self._cleanup()
 
+    def _start_hardware(self):
+        self._alert_led.setup_on_pin(13, "red")
+        self._screensaver_led.setup_on_pin(19, "green")
+        self._btn_mgr.start()
+
+    @property
+    def bus_workers(self):
+        """
+        The bus workers of every port a screen is on. Each writes to its own bus, so ports are flushed in parallel.
+        """
+        workers = OrderedDict()
+        for slot in self._slots.values():
+            workers.setdefault(slot.screen.port, get_bus_worker(slot.screen.port))
+        return workers
+
+    def _drain_bus_workers(self):
+        for worker in self.bus_workers.values():
+            worker.drain()
+
+    def _start_bus_workers(self):
+        workers = self.bus_workers
+        for slot in self._slots.values():
+            slot.screen.worker = workers[slot.screen.port]
+        for worker in workers.values():
+            worker.start()
+
+    def _stop_bus_workers(self):
+        for worker in self.bus_workers.values():
+            worker.stop()
+
     def _cleanup(self):
-        self._left_screen.clear_screen()
-        self._right_screen.clear_screen()
+        self._running = False
+        self._scheduler.stop()
+        if self._glyph_cache_timer is not None:
+            self._glyph_cache_timer.cancel()
+            self._glyph_cache_timer = None
+        save_atlases()
+        for slot in self._slots.values():
+            slot.screen.clear_screen()
+        self._stop_bus_workers()
+        self.stop_recording()
         self._btn_mgr.cleanup()
         self._alert_led.close()
         self._screensaver_led.close()
 
     class ButtonController(DPadButtonControllerMixin):
+        """
+        Left and right move focus between screens side by side. Holding up or down moves it between rows of screens,
+        since a press alone belongs to the focused window.
+        """
+
         def __init__(self, window_manager):
             super(WindowManager.ButtonController, self).__init__()
             self._window_manager = window_manager
 
         def _left_pressed(self):
             self._window_manager.focus_left()
+            return True
 
         def _right_pressed(self):
             self._window_manager.focus_right()
+            return True
+
+        def _up_held(self):
+            return self._window_manager.focus_up()
+
+        def _down_held(self):
+            return self._window_manager.focus_down()
+
+
+class DualScreenWindowManager(WindowManager):
+    """
+    The original two panel set-up, a left screen and a right screen side by side.
+    """
+
+    LEFT = "left"
+    RIGHT = "right"
+
+    def __init__(self, left_screen, right_screen, fps=FrameScheduler.DEFAULT_FPS,
+                 frame_cache_size=FrameCache.DEFAULT_SIZE):
+        super(DualScreenWindowManager, self).__init__(fps, frame_cache_size)
+        self.add_screen(left_screen, 0, 0, self.LEFT)
+        self.add_screen(right_screen, 1, 0, self.RIGHT)
+
+    @property
+    def left_window(self):
+        return self.get_window(self.LEFT)
+
+    @left_window.setter
+    def left_window(self, value):
+        self.set_window(self.LEFT, value)
+
+    @property
+    def right_window(self):
+        return self.get_window(self.RIGHT)
+
+    @right_window.setter
+    def right_window(self, value):
+        self.set_window(self.RIGHT, value)
 
 
 class AbstractWindow(object):
 
     # todo: implement title bar sizing in this class
-    # todo: implement needs_refresh logic to prevent unnecessary re-draws
-    # todo: implement _opened and _closed functionality
+
+    # Windows that only call rectangle() and bitmap(), or draw text through the atlas, can set this to draw straight
+    # into a PageFrameBuffer. Others get an ImageDraw canvas whose image is converted afterwards.
+    PACKED_CANVAS = False
+
+    _sequence = itertools.count(1)
 
     def __init__(self, window_title, font=DEFAULT_FONT_PATH, font_size=DEFAULT_FONT_SIZE, screen=None):
         super(AbstractWindow, self).__init__()
+        self._name = "{}-{}".format(type(self).__name__, next(AbstractWindow._sequence))
         self._window_title = window_title
         self._image_font = None
+        self._font_key = None
+        self._atlas = None
         self._focused = False
+        self._frame = None
+        self._invalid = True
+        self._damage = []
+        self._traces = []
+        self._presented = False
+        self._scheduler = None
+        self._layers = []
+        self._stack = None
+        self._screen = screen
         self.font_size = font_size  # TODO: Need a better way to manage this value
         self.font = font, font_size
-        self._screen = screen
+
+    @property
+    def name(self):
+        """
+        Unique to this window and fixed for its lifetime, unlike the title. Stats are kept under it.
+        """
+        return self._name
 
     @property
     def title(self):
@@ -142,7 +618,9 @@ class AbstractWindow(object):
 
     @title.setter
     def title(self, value):
-        self._window_title = value
+        if value != self._window_title:
+            self._window_title = value
+            self._when_title_changed()
 
     @property
     def screen(self):
@@ -150,10 +628,55 @@ class AbstractWindow(object):
 
     @screen.setter
     def screen(self, value):
-        self._screen = value
+        if value is not self._screen:
+            self._screen = value
+            self._presented = False
+
+    @property
+    def stack(self):
+        """
+        The WindowStack this window is open on, or None.
+        """
+        return self._stack
+
+    @stack.setter
+    def stack(self, value):
+        self._stack = value
+
+    def push_window(self, window):
+        """
+        Opens the window on top of this one, on the same screen.
+        """
+        if self._stack is None:
+            raise ValueError("{} is not open on a screen.".format(self.title))
+        self._stack.push(window)
+
+    def close(self):
+        """
+        Goes back to the window under this one. Returns False when this is not the top of a stack with one under it.
+        """
+        if self._stack is None or self._stack.top is not self or len(self._stack) < 2:
+            return False
+        self._stack.pop()
+        return True
+
+    @property
+    def scheduler(self):
+        return self._scheduler
+
+    @scheduler.setter
+    def scheduler(self, value):
+        if value is not self._scheduler:
+            self._scheduler = value
+            self._when_scheduled()
 
     @property
     def font(self):
+        """
+        The window's ImageFont, opened the first time it is asked for.
+        """
+        if self._image_font is None and self._font_key is not None:
+            self._image_font = FontRegistry().acquire(*self._font_key)
         return self._image_font
 
     @font.setter
@@ -164,15 +687,126 @@ class AbstractWindow(object):
         else:
             filename = value
             font_size = DEFAULT_FONT_SIZE
-        font_path = os.path.abspath(filename)
-        self._image_font = ImageFont.truetype(font_path, font_size)
+        if self._image_font is not None:
+            FontRegistry().release(*self._font_key)
+            self._image_font = None
+        self._font_key = os.path.abspath(filename), font_size
+        self._atlas = None
+        for layer in self._layers:
+            layer.invalidate()
+        self.invalidate()
+
+    @property
+    def atlas(self):
+        if self._atlas is None:
+            self._atlas = get_atlas(*self._font_key)
+        return self._atlas
+
+    @property
+    def layers(self):
+        return self._layers
+
+    def add_layer(self, layer):
+        """
+        Adds a layer drawn over what draw() produces. Layers are kept as cached bitmaps, so draw() remains the place for
+        anything that changes from frame to frame.
+        """
+        self._layers.append(layer)
+        self.invalidate()
+
+    def remove_layer(self, layer):
+        self._layers.remove(layer)
+        self.invalidate()
+
+    def _draw_text(self, canvas, xy, text, fill):
+        self.atlas.draw_text(canvas, xy, text, fill)
 
     def draw(self, screen, image_draw_canvas):
         raise NotImplementedError(not_implemented(self, "draw()"))
 
+    def draw_region(self, screen, image_draw_canvas, rect):
+        """
+        Override this method to draw only what intersects the given rect. Anything drawn outside of it is discarded.
+        """
+        self.draw(screen, image_draw_canvas)
+
+    def invalidate(self, rect=None):
+        """
+        Marks the retained frame as stale. Call this whenever a change in state affects what draw() produces, passing
+        a Rect when only that part of the frame changed.
+        """
+        if rect is None:
+            self._invalid = True
+            self._damage = []
+        elif not self._invalid:
+            self._damage.append(rect)
+        # A window off screen has no frame coming for the event to wait on.
+        if self._screen is not None:
+            LatencyTracer().attach(self._traces)
+
+    def take_traces(self):
+        """
+        Returns and forgets the latency traces of the input events that led to the pending changes.
+        """
+        traces = self._traces
+        self._traces = []
+        return traces
+
+    def drop_traces(self):
+        """
+        Completes the pending latency traces without a frame, for when the window will not be drawn.
+        """
+        LatencyTracer().complete(self.take_traces())
+
+    @property
+    def invalid(self):
+        return self._invalid or len(self._damage) > 0
+
+    @property
+    def frame(self):
+        return self._frame
+
+    def release_frame(self):
+        """
+        Drops the retained frame, so the window is drawn in full when it is next shown.
+        """
+        self._frame = None
+        self._invalid = True
+        self._damage = []
+        self.drop_traces()
+
+    def render(self, screen):
+        """
+        Brings the retained frame up to date for the given screen. Returns the rects that were redrawn, or None when
+        the whole frame was.
+        """
+        size = (screen.width, screen.height)
+        if self._invalid or self._frame is None or self._frame.size != size:
+            self._frame = screen.rasterize(self)
+            damage = None
+        else:
+            damage = self._damage
+            if damage:
+                screen.rasterize(self, damage, self._frame)
+        if self._layers:
+            composite_layers(screen, self._frame, self._layers, damage)
+        self._invalid = False
+        self._damage = []
+        return damage
+
     def refresh(self):
-         if self._screen is not None:
-             self._screen.draw_window(self)
+        """
+        Redraws the window if it changed, on the scheduler's next tick when it has one or right away otherwise.
+        """
+        if self._scheduler is not None:
+            self._scheduler.request(self)
+        else:
+            self.redraw()
+
+    def redraw(self):
+        if self._screen is not None and (self.invalid or not self._presented):
+            self._screen.draw_window(self)
+            self._presented = True
 
     @property
     def focused(self):
@@ -183,6 +817,7 @@ class AbstractWindow(object):
         if type(value) is bool:
             if value != self._focused:
                 self._focused = value
+                self.invalidate()
                 self._when_focused() if self.focused else self._when_unfocused()
                 self.refresh()
         else:
@@ -194,6 +829,12 @@ class AbstractWindow(object):
     def _when_unfocused(self):
         pass
 
+    def _when_scheduled(self):
+        pass
+
+    def _when_title_changed(self):
+        self.invalidate()
+
     def _when_opened(self):
         pass
 
@@ -229,45 +870,194 @@ class ScrollableWindow(AbstractWindow, DPadButtonControllerMixin, OkCancelButton
         super(ScrollableWindow, self)._cancel_pressed()
 
 
-class MenuWindow(AbstractWindow, DPadButtonControllerMixin, OkCancelButtonControllerMixin):
+class MenuWindow(TitleBarMixin, AbstractWindow, DPadButtonControllerMixin, OkCancelButtonControllerMixin):
 
-    # TODO: Move SCREEN_TOP and other header-related code to special class for split-color ssd1306 screens? TitleBarMixin. Windows will query this info during draw()
-    SCREEN_TOP = 16
+    PACKED_CANVAS = True
     PADDING_LEFT = 2
     PADDING_TOP = 1
     PADDING_BOTTOM = 1
     PADDING_RIGHT = 2
+    MARQUEE_INTERVAL = 0.05
+    MARQUEE_STEP = 1
+    MARQUEE_GAP = 16
 
     def __init__(self, window_title, font=DEFAULT_FONT_PATH, font_size=DEFAULT_FONT_SIZE, screen=None):
         super(MenuWindow, self).__init__(window_title, font, font_size, screen)
         self._position = -1
-        self._menu_items = []
+        self._scroll = 0
+        self._marquee = False
+        self._marquee_timer = None
+        self._title_offset = 0
+        self._item_offset = 0
+        self._data_source = None
+        self._menu_items = None
         self._outline = False
+        self.data_source = ListMenuDataSource()
+
+    def _setup_buttons(self):
+        # Each mixin's _setup_buttons() would otherwise hide the other's, leaving OK and cancel unbound.
+        DPadButtonControllerMixin._setup_buttons(self)
+        OkCancelButtonControllerMixin._setup_buttons(self)
+
+    @property
+    def data_source(self):
+        return self._data_source
+
+    @data_source.setter
+    def data_source(self, value):
+        """
+        Paged sources are read through a bounded cache, so only the pages around the viewport are held in memory.
+        """
+        self._data_source = value
+        self._menu_items = CachedMenuDataSource(value) if value.paged else value
+        self._position = -1
+        self._scroll = 0
+        self.invalidate()
+        if self._focused:
+            self.position = 0
+
+    @property
+    def marquee(self):
+        """
+        When True, a title or selected item too wide for the screen scrolls sideways. Each step redraws only its row.
+        """
+        return self._marquee
+
+    @marquee.setter
+    def marquee(self, value):
+        if type(value) is not bool:
+            raise TypeError("Expects a boolean value.")
+        self._marquee = value
+        self._update_marquee()
+
+    def _when_scheduled(self):
+        self._update_marquee()
+
+    def _update_marquee(self):
+        if self._marquee and self._scheduler is not None:
+            if self._marquee_timer is None:
+                self._marquee_timer = self._scheduler.animate(self.MARQUEE_INTERVAL, self._marquee_tick)
+        elif self._marquee_timer is not None:
+            self._marquee_timer.cancel()
+            self._marquee_timer = None
+            self._title_offset = self._item_offset = 0
+            self._title_layer.invalidate()
+            self.invalidate()
+            self.refresh()
+
+    def _advance_marquee(self, offset, text, width):
+        text_width = self.atlas.get_width(text)
+        if text_width <= width - self.PADDING_LEFT - self.PADDING_RIGHT:
+            return 0
+        return (offset + self.MARQUEE_STEP) % (text_width + self.MARQUEE_GAP)
+
+    def _marquee_tick(self):
+        if self._screen is None:
+            return
+        width = self._screen.width
+        offset = self._advance_marquee(self._title_offset, self.title, width)
+        if offset != self._title_offset:
+            self._title_offset = offset
+            self.invalidate_title()
+        if 0 <= self._position < self._menu_items.count():
+            offset = self._advance_marquee(self._item_offset, self._menu_items.get_item(self._position).title, width)
+            if offset != self._item_offset:
+                self._item_offset = offset
+                self._invalidate_row(self._position)
+        if self.invalid:
+            self.refresh()
+
+    def _draw_marquee_text(self, canvas, xy, text, fill, offset):
+        x, y = xy
+        self._draw_text(canvas, (x - offset, y), text, fill)
+        if offset > 0:
+            self._draw_text(canvas, (x - offset + self.atlas.get_width(text) + self.MARQUEE_GAP, y), text, fill)
+
+    def reload(self):
+        """
+        Drops cached items and counts after the data source's contents have changed.
+        """
+        self._menu_items.clear()
+        # Clamped here rather than through the position setter, which would only invalidate the rows it moved between.
+        self._position = min(self._position, self._menu_items.count() - 1)
+        self._item_offset = 0
+        if self._screen is not None:
+            self._scroll_into_view(self._screen.height)
+        self.invalidate()
+        self.refresh()
 
     def add_menu_item(self, title, callback, index=None):
-        menu_item = MenuItem(title, callback)
-        if index is not None:
-            self._menu_items.insert(index, menu_item)
-        else:
-            self._menu_items.append(menu_item)
+        if not isinstance(self._data_source, ListMenuDataSource):
+            raise TypeError("Menu items can only be added to a ListMenuDataSource.")
+        self._data_source.add_item(MenuItem(title, callback), index)
+        self.invalidate()
+
+    def add_submenu(self, title, window, index=None):
+        """
+        Adds an item that opens the window on top of this one.
+        """
+        self.add_menu_item(title, lambda: self.push_window(window), index)
+
+    def _row_pitch(self):
+        return self.PADDING_TOP + self.font_size + self.PADDING_BOTTOM
+
+    def _row_rect(self, index, width):
+        top = self.SCREEN_TOP + (index - self._scroll) * self._row_pitch()
+        return Rect(0, top, width - 1, top + self.PADDING_TOP + self.font_size)
+
+    def _visible_rows(self, height):
+        # Rows that fit entirely between the title bar and the bottom of the screen
+        return max((height - 1 - self.SCREEN_TOP - self.PADDING_TOP - self.font_size) // self._row_pitch() + 1, 1)
+
+    def _visible_range(self, height):
+        return xrange(self._scroll, min(self._scroll + self._visible_rows(height), self._menu_items.count()))
+
+    def _scroll_into_view(self, height):
+        """
+        Moves the viewport the least distance that brings the selected row into view. Returns True if it moved.
+        """
+        rows = self._visible_rows(height)
+        scroll = min(max(self._scroll, self._position - rows + 1), max(self._position, 0))
+        scroll = max(min(scroll, self._menu_items.count() - rows), 0)
+        if scroll == self._scroll:
+            return False
+        self._scroll = scroll
+        return True
+
+    def _invalidate_row(self, index):
+        if self._screen is None:
+            self.invalidate()
+        elif index in self._visible_range(self._screen.height):
+            self.invalidate(self._row_rect(index, self._screen.width))
 
     def draw(self, screen, canvas):
-        canvas.setfont(self.font)
-        canvas.text((self.PADDING_LEFT, 0), self.title, fill=screen.fill_solid)
-        top = self.SCREEN_TOP
-        i = 0
-        for item in self._menu_items:
-            y = top + self.PADDING_TOP
-            bottom = y + self.font_size
-            if i == self._position:
-                f = screen.fill_empty if self._outline else screen.fill_solid
-                o = screen.fill_solid if self._outline else screen.fill_empty
-                canvas.rectangle((0, top, screen.width-1, bottom), fill=f, outline=o)
-                canvas.text((self.PADDING_LEFT, y), item.title, fill=o)
-            else:
-                canvas.text((self.PADDING_LEFT, y), item.title, fill=screen.fill_solid)
-            top = bottom + self.PADDING_BOTTOM
-            i += 1
+        self._scroll_into_view(screen.height)
+        self.draw_region(screen, canvas, Rect(0, 0, screen.width - 1, screen.height - 1))
+
+    def _draw_title(self, screen, canvas):
+        self._draw_marquee_text(canvas, (self.PADDING_LEFT, 0), self.title, screen.fill_solid, self._title_offset)
+
+    def draw_region(self, screen, canvas, rect):
+        visible = self._visible_range(screen.height)
+        if len(visible):
+            self._menu_items.prefetch(visible[0], visible[-1] + 1)
+        for i in visible:
+            row = self._row_rect(i, screen.width)
+            if row.top > rect.bottom:
+                break
+            if intersects(row, rect):
+                self._draw_item(screen, canvas, i, row)
+
+    def _draw_item(self, screen, canvas, index, row):
+        item = self._menu_items.get_item(index)
+        y = row.top + self.PADDING_TOP
+        if index == self._position:
+            f = screen.fill_empty if self._outline else screen.fill_solid
+            o = screen.fill_solid if self._outline else screen.fill_empty
+            canvas.rectangle(row, fill=f, outline=o)
+            self._draw_marquee_text(canvas, (self.PADDING_LEFT, y), item.title, o, self._item_offset)
+        else:
+            self._draw_text(canvas, (self.PADDING_LEFT, y), item.title, screen.fill_solid)
 
     @property
     def position(self):
@@ -275,14 +1065,26 @@ class MenuWindow(AbstractWindow, DPadButtonControllerMixin, OkCancelButtonContro
 
     @position.setter
     def position(self, value):
-        if self._position == value:
+        count = self._menu_items.count()
+        if count == 0:
+            # Nothing to select; clamping would only bounce between -1 and 0.
+            if self._position != -1:
+                self._position = -1
+                self._scroll = 0
+                self._item_offset = 0
+                self.invalidate()
+                self.refresh()
             return
-        if value < 0:
-            self.position = 0
-        elif value >= len(self._menu_items):
-            self.position = len(self._menu_items) - 1
-        else:
+        value = max(min(value, count - 1), 0)
+        if self._position != value:
+            self._invalidate_row(self._position)
             self._position = value
+            self._item_offset = 0
+            if self._screen is not None and self._scroll_into_view(self._screen.height):
+                width, height = self._screen.width, self._screen.height
+                self.invalidate(Rect(0, self.SCREEN_TOP, width - 1, height - 1))
+            else:
+                self._invalidate_row(self._position)
             self.refresh()
 
     def _when_unfocused(self):
@@ -300,9 +1102,11 @@ class MenuWindow(AbstractWindow, DPadButtonControllerMixin, OkCancelButtonContro
         self.position -= 1
 
     def _ok_pressed(self):
-        # TODO: execute callback on selected menu item
-        pass
+        if 0 <= self._position < self._menu_items.count():
+            callback = self._menu_items.get_item(self._position).callback
+            if callback is not None:
+                callback()
+                return True
 
     def _cancel_pressed(self):
-        # TODO: go back one item in the history stack
-        pass
+        return self.close()
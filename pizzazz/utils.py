@@ -1,9 +1,48 @@
-from collections import Iterable
+import ctypes
+import os
+import threading
+import time
+from bisect import bisect_right
+from collections import Iterable, OrderedDict
 from textwrap import TextWrapper
 from types import NoneType
 
 from PIL import ImageFont
 
+from stats import get_stats
+
+CLOCK_MONOTONIC = 1
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+def _load_clock_gettime():
+    # Loaded by soname rather than through ctypes.util.find_library(), which shells out and slows down start-up.
+    for library in ("libc.so.6", "librt.so.1"):
+        try:
+            clock_gettime = ctypes.CDLL(library).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+        return clock_gettime
+    return None
+
+
+_clock_gettime = _load_clock_gettime()
+
+
+def monotonic_ns():
+    """
+    Nanoseconds from a clock that never jumps, for measuring intervals. Python 2 has no time.monotonic().
+    """
+    if _clock_gettime is None:
+        return int(time.time() * 1000000000)
+    timespec = _Timespec()
+    _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(timespec))
+    return timespec.tv_sec * 1000000000 + timespec.tv_nsec
+
 
 def is_iterable(obj):
     return isinstance(obj, Iterable)
@@ -24,10 +63,14 @@ def midpoint(a, b):
 class Singleton(type):
 
     _instances = {}
+    # Reentrant, as a singleton's __init__ may reach for another one.
+    _lock = threading.RLock()
 
     def __call__(cls, *more):
         if cls not in cls._instances:
-            cls._instances[cls] = super(Singleton, cls).__call__(*more)
+            with Singleton._lock:
+                if cls not in cls._instances:
+                    cls._instances[cls] = super(Singleton, cls).__call__(*more)
         return cls._instances[cls]
 
 
@@ -43,18 +86,127 @@ class TextAlignment(object):
         return value in (TextAlignment.LEFT, TextAlignment.RIGHT, TextAlignment.CENTER, TextAlignment.JUSTIFY)
 
 
+class FontRegistry(object):
+
+    __metaclass__ = Singleton
+
+    # Fonts nobody holds a reference to are kept around up to this count, least recently released evicted first.
+    __MAX_UNUSED = 8
+
+    def __init__(self):
+        super(FontRegistry, self).__init__()
+        self._fonts = {}
+        self._references = {}
+        self._unused = OrderedDict()
+        # Acquired from the input, frame scheduler and bus worker threads alike.
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(filename, size):
+        return os.path.abspath(filename), size
+
+    def acquire(self, filename, size):
+        key = self._key(filename, size)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                get_stats().cache_hit("fonts")
+            else:
+                get_stats().cache_miss("fonts")
+                font = ImageFont.truetype(key[0], size)
+                self._fonts[key] = font
+                self._references[key] = 0
+            self._references[key] += 1
+            self._unused.pop(key, None)
+            return font
+
+    def release(self, filename, size):
+        key = self._key(filename, size)
+        with self._lock:
+            if self._references.get(key, 0) == 0:
+                return
+            self._references[key] -= 1
+            if self._references[key] == 0:
+                self._unused[key] = True
+                while len(self._unused) > self.__MAX_UNUSED:
+                    evicted, _ = self._unused.popitem(last=False)
+                    del self._fonts[evicted]
+                    del self._references[evicted]
+
+    def references(self, filename, size):
+        return self._references.get(self._key(filename, size), 0)
+
+    def __len__(self):
+        return len(self._fonts)
+
+
 class Font(object):
 
+    __SIZE_CACHE_SIZE = 256
+
     def __init__(self):
         super(Font, self).__init__()
         self._filename = None
         self._size = 10
         self._font = None
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self._extents = {}
+        self._advances = {}
+        self._kerning = {}
+        self._sizes = OrderedDict()
+
+    def _get_extent(self, character):
+        extent = self._extents.get(character)
+        if extent is None:
+            extent = self._font.getsize(character)
+            self._extents[character] = extent
+        return extent
+
+    def _get_advance(self, character):
+        # The distance between two copies of a character is its pen advance; its own width is only the ink extent.
+        advance = self._advances.get(character)
+        if advance is None:
+            advance = self._font.getsize(character * 2)[0] - self._get_extent(character)[0]
+            self._advances[character] = advance
+        return advance
+
+    def _get_kerning(self, left, right):
+        pair = left + right
+        kerning = self._kerning.get(pair)
+        if kerning is None:
+            kerning = self._font.getsize(pair)[0] - self._get_advance(left) - self._get_extent(right)[0]
+            self._kerning[pair] = kerning
+        return kerning
+
+    def _get_pen_positions(self, text):
+        positions = []
+        x = 0
+        for i in xrange(len(text)):
+            positions.append(x)
+            if i + 1 < len(text):
+                x += self._get_advance(text[i]) + self._get_kerning(text[i], text[i + 1])
+        return positions
+
+    def _measure(self, text):
+        # Pillow's own figure, which pen positions built from pairs cannot always reproduce, for instance around
+        # trailing spaces. The LRU in _get_size() keeps repeated strings from reaching FreeType.
+        return self._font.getsize(text)
 
     def _get_size(self, text):
         if len(text) == 0:
-            return 0
-        size = self._font.getsize(text)
+            return 0, 0
+        size = self._sizes.get(text)
+        if size is not None:
+            get_stats().cache_hit("text_sizes")
+            del self._sizes[text]
+        else:
+            get_stats().cache_miss("text_sizes")
+            size = self._measure(text)
+            if len(self._sizes) >= self.__SIZE_CACHE_SIZE:
+                self._sizes.popitem(last=False)
+        self._sizes[text] = size
         return size
 
     def get_width(self, text):
@@ -63,11 +215,23 @@ class Font(object):
     def get_height(self, text):
         return self._get_size(text)[1]
 
+    def get_prefix_widths(self, text):
+        """
+        Returns a list where item i estimates the width of text[:i], from cached advances and kerning in a single pass
+        over the text. The estimate can be off from get_width() by a few pixels, so use it to narrow a search and
+        get_width() to confirm the result. Widths never decrease, so the list can be bisected.
+        """
+        widths = [0]
+        for i, x in enumerate(self._get_pen_positions(text)):
+            widths.append(max(widths[-1], x + self._get_extent(text[i])[0]))
+        return widths
+
     @staticmethod
     def _create_font(filename, size):
-        return ImageFont.truetype(filename, size)
+        return FontRegistry().acquire(filename, size)
 
     def _init_font(self, filename=None, size=None):
+        previous = (self._filename, self._size) if self._font is not None else None
         changed = False
         if filename is None:
             filename = self._filename
@@ -81,6 +245,9 @@ class Font(object):
             changed = True
         if self._font is None or changed is True:
             self._font = self._create_font(filename, size)
+            self._reset_metrics()
+            if previous is not None:
+                FontRegistry().release(*previous)
 
     @property
     def font(self):
@@ -122,6 +289,25 @@ class ImageFontTextWrapper(TextWrapper):
     def _get_width(self, text):
         return self._font.get_width(text)
 
+    def _handle_long_word(self, reversed_chunks, cur_line, cur_len, width):
+        # TextWrapper counts characters here; find the longest prefix that fits in the remaining pixels instead.
+        space_left = max(width - cur_len, 1)
+        if self.break_long_words:
+            chunk = reversed_chunks[-1]
+            end = bisect_right(self._font.get_prefix_widths(chunk), space_left) - 1
+            # The prefix widths are an estimate; settle the exact cut with real measurements either side of it.
+            while end > 1 and self._get_width(chunk[:end]) > space_left:
+                end -= 1
+            while end < len(chunk) and self._get_width(chunk[:end + 1]) <= space_left:
+                end += 1
+            if end < 1 and not cur_line:
+                end = 1
+            if end > 0:
+                cur_line.append(chunk[:end])
+                reversed_chunks[-1] = chunk[end:]
+        elif not cur_line:
+            cur_line.append(reversed_chunks.pop())
+
     @property
     def font(self):
         return self._font
@@ -137,6 +323,9 @@ class ImageFontTextWrapper(TextWrapper):
         if self._font is None:
             raise ValueError("imagefont not defined")
 
+        initial_width = self.width - self._get_width(self.initial_indent)
+        subsequent_width = self.width - self._get_width(self.subsequent_indent)
+
         chunks.reverse()
         while chunks:
             cur_line = []
@@ -144,13 +333,15 @@ class ImageFontTextWrapper(TextWrapper):
 
             if lines:
                 indent = self.subsequent_indent
+                width = subsequent_width
             else:
                 indent = self.initial_indent
-            width = self.width - self._get_width(indent)
+                width = initial_width
 
             if self.drop_whitespace and chunks[-1].strip() == '' and lines:
                 del chunks[-1]
 
+            w = 0
             while chunks:
                 w = self._get_width(chunks[-1])
 
@@ -160,7 +351,7 @@ class ImageFontTextWrapper(TextWrapper):
                 else:
                     break
 
-            if chunks and self._get_width(chunks[-1]) > width:
+            if chunks and w > width:
                 self._handle_long_word(chunks, cur_line, cur_width, width)
 
             if self.drop_whitespace and cur_line and cur_line[-1].strip() == '':
@@ -0,0 +1,72 @@
+import argparse
+import os
+import sys
+
+from pizzazz.recording import FrameReplay
+
+##########
+# Inspects recordings made with WindowManager.start_recording().
+#   python replay.py capture.pzr                  summary of screens, frames and timing
+#   python replay.py capture.pzr --frame 120      write a single frame as PNG
+#   python replay.py capture.pzr --export frames  write every frame as PNG
+#   python replay.py capture.pzr --hitches 100    list gaps between frames longer than 100ms
+##########
+
+
+def summarize(replay):
+    print "{} frames".format(len(replay))
+    for screen_id, info in sorted(replay.screens.items()):
+        records = [replay.record(i) for i in xrange(len(replay)) if replay.record(i).screen == screen_id]
+        if not records:
+            continue
+        seconds = (records[-1].timestamp - records[0].timestamp) / 1e9
+        payload = sum(record.length for record in records)
+        print "{}: {}x{}, {} frames over {:.1f}s, {:.1f} bytes/frame".format(
+            info.name, info.width, info.height, len(records), seconds, payload / float(len(records)))
+
+
+def hitches(replay, threshold_ms):
+    previous = {}
+    for i in xrange(len(replay)):
+        record = replay.record(i)
+        if record.screen in previous:
+            gap = (record.timestamp - previous[record.screen]) / 1e6
+            if gap > threshold_ms:
+                print "frame {} on {}: {:.1f}ms since the last frame".format(i, replay.screens[record.screen].name,
+                                                                              gap)
+        previous[record.screen] = record.timestamp
+
+
+def export(replay, directory):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for i, frame in enumerate(replay):
+        frame.image.save(os.path.join(directory, "{:06d}-{}.png".format(i, frame.screen)), "PNG")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a Pizzazz frame recording.")
+    parser.add_argument("recording")
+    parser.add_argument("--frame", type=int, help="index of a single frame to write out")
+    parser.add_argument("--out", default="frame.png", help="where --frame is written")
+    parser.add_argument("--export", metavar="DIR", help="write every frame as a PNG into DIR")
+    parser.add_argument("--hitches", type=float, metavar="MS", help="list frame gaps longer than MS")
+    args = parser.parse_args()
+
+    replay = FrameReplay(args.recording)
+    try:
+        if args.frame is not None:
+            replay.frame(args.frame).image.save(args.out, "PNG")
+        elif args.export:
+            export(replay, args.export)
+        elif args.hitches is not None:
+            hitches(replay, args.hitches)
+        else:
+            summarize(replay)
+    finally:
+        replay.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
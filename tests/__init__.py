@@ -0,0 +1,21 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FONT_PATH = os.path.join(ROOT, "fonts", "Super-Mario-World.ttf")
+
+# The modules import each other by bare name, as they do when pizzazz.py runs them.
+sys.path.insert(0, os.path.join(ROOT, "pizzazz"))
+
+
+def random_image(rng, width=128, height=64):
+    """
+    A 1-bit image of random filled and cleared rectangles, some straddling the edges.
+    """
+    from PIL import Image, ImageDraw
+    image = Image.new("1", (width, height), 0)
+    draw = ImageDraw.Draw(image)
+    for _ in xrange(12):
+        left, top = rng.randint(-8, width), rng.randint(-8, height)
+        draw.rectangle((left, top, left + rng.randint(0, 40), top + rng.randint(0, 20)), fill=rng.choice((0, 255)))
+    return image
@@ -0,0 +1,69 @@
+import unittest
+
+import glyphs
+from emulator import EmulatedSSD1306
+from input import ButtonEvent, ACTION_PRESSED
+from tests import FONT_PATH
+from ui import MenuWindow, DualScreenWindowManager
+
+
+def setUpModule():
+    # Keep glyph cache files out of the home directory.
+    glyphs.GLYPH_CACHE_DIR = None
+
+
+def build_menu(title, count):
+    menu = MenuWindow(title, font=FONT_PATH)
+    for i in xrange(count):
+        menu.add_menu_item("Item {}".format(i), None)
+    return menu
+
+
+class BackStackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.left = EmulatedSSD1306(0x3D)
+        self.window_manager = DualScreenWindowManager(self.left, EmulatedSSD1306(0x3C), frame_cache_size=2)
+        self.root = build_menu("Root", 3)
+        self.window_manager.left_window = self.root
+        self.window_manager.right_window = build_menu("Right", 3)
+        self.window_manager.scheduler.flush()
+
+    def _press(self, name):
+        self.window_manager._dispatch_button_event(ButtonEvent(0, name, ACTION_PRESSED, 0))
+
+    def test_cancel_shows_the_cached_frame_at_once(self):
+        self.root.add_submenu("Deeper", build_menu("Deeper", 4))
+        self._press("down")
+        self._press("down")
+        self._press("down")
+        self.window_manager.scheduler.flush()
+        shown = self.left.to_image().tobytes()
+        self._press("ok")
+        self.window_manager.scheduler.flush()
+        self.assertEqual(len(self.window_manager.get_stack(DualScreenWindowManager.LEFT)), 2)
+        self.assertNotEqual(self.left.to_image().tobytes(), shown)
+        self._press("cancel")
+        # Before the scheduler's next tick.
+        self.assertEqual(self.left.to_image().tobytes(), shown)
+        self.window_manager.scheduler.flush()
+        self.assertEqual(self.left.to_image().tobytes(), shown)
+        self.assertEqual(len(self.window_manager.get_stack(DualScreenWindowManager.LEFT)), 1)
+
+    def test_cancel_on_the_bottom_window_does_nothing(self):
+        self._press("cancel")
+        self.assertIs(self.window_manager.get_window(DualScreenWindowManager.LEFT), self.root)
+
+    def test_closed_windows_release_their_frames(self):
+        pushed = [build_menu("Pushed {}".format(i), 2) for i in xrange(4)]
+        for window in pushed:
+            self.window_manager.push_window(DualScreenWindowManager.LEFT, window)
+            self.window_manager.scheduler.flush()
+        self.assertEqual(len(self.window_manager.frame_cache), 2)
+        self.assertIsNone(self.root.frame)
+        self.window_manager.left_window = build_menu("Replacement", 2)
+        self.assertTrue(all(window.frame is None for window in pushed))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import random
+import threading
+import unittest
+
+import display
+from display import I2CBusWorker
+from emulator import EmulatedSSD1306, FakeSSD1306Device
+from framebuffer import PageFrameBuffer
+from tests import random_image
+
+
+class FlakyDevice(FakeSSD1306Device):
+    """
+    Fails the next command after fail is set, as a NACK on a shared bus would.
+    """
+
+    def __init__(self, **kwargs):
+        super(FlakyDevice, self).__init__(**kwargs)
+        self.fail = False
+
+    def command(self, *cmd):
+        if self.fail:
+            self.fail = False
+            raise IOError("I2C write NACKed")
+        super(FlakyDevice, self).command(*cmd)
+
+
+class BlockingDevice(FakeSSD1306Device):
+    """
+    Holds every data write until release is set.
+    """
+
+    def __init__(self, **kwargs):
+        super(BlockingDevice, self).__init__(**kwargs)
+        self.writing = threading.Event()
+        self.release = threading.Event()
+        self.sent = []
+
+    def data(self, data):
+        self.writing.set()
+        self.release.wait()
+        super(BlockingDevice, self).data(data)
+        self.sent.append(self.to_image().tobytes())
+
+
+class WorkerScreen(EmulatedSSD1306):
+
+    def __init__(self, device, i2c_address=0x3C, i2c_port=8):
+        super(WorkerScreen, self).__init__(i2c_address, i2c_port)
+        self._device = device
+
+
+class I2CBusWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = random.Random(9)
+        display.logger.disabled = True
+        self.worker = I2CBusWorker(8)
+        self.worker.start()
+
+    def tearDown(self):
+        self.worker.stop()
+        display.logger.disabled = False
+
+    def test_failed_write_does_not_stall_later_frames(self):
+        device = FlakyDevice(port=8)
+        screen = WorkerScreen(device)
+        screen.worker = self.worker
+        images = [random_image(self.rng) for _ in xrange(4)]
+        for i, image in enumerate(images):
+            device.fail = i == 1
+            screen.draw_frame(PageFrameBuffer.from_image(image))
+            self.worker.drain()
+        self.assertTrue(self.worker.running)
+        self.assertEqual(screen.to_image().tobytes(), images[-1].tobytes())
+
+    def test_frame_after_a_failure_is_sent_in_full(self):
+        device = FlakyDevice(port=8)
+        screen = WorkerScreen(device)
+        screen.worker = self.worker
+        screen.draw_frame(PageFrameBuffer.from_image(random_image(self.rng)))
+        self.worker.drain()
+        device.fail = True
+        changed = PageFrameBuffer.from_image(random_image(self.rng))
+        screen.draw_frame(changed)
+        self.worker.drain()
+        # Unchanged since the failed frame, but the panel may not show it, so it still goes out.
+        screen.bus.reset_stats()
+        screen.draw_frame(changed.copy())
+        self.worker.drain()
+        self.assertEqual(screen.bus.data_bytes, 1024)
+        self.assertEqual(screen.to_image().tobytes(), changed.to_image().tobytes())
+
+    def test_render_thread_runs_ahead_of_the_bus(self):
+        device = BlockingDevice(port=8)
+        screen = WorkerScreen(device)
+        screen.worker = self.worker
+        images = [random_image(self.rng) for _ in xrange(3)]
+        screen.draw_frame(PageFrameBuffer.from_image(images[0]))
+        device.writing.wait(5)
+        # The first frame is held on the bus; the next two fill the queue without waiting for it.
+        for image in images[1:]:
+            screen.draw_frame(PageFrameBuffer.from_image(image))
+        self.assertEqual(device.sent, [])
+        device.release.set()
+        self.worker.drain()
+        self.assertEqual(screen.to_image().tobytes(), images[-1].tobytes())
+        self.assertEqual(device.sent[-1], images[-1].tobytes())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+from input import ButtonEvent, ACTION_PRESSED, ACTION_RELEASED
+from mixins import AbstractButtonControllerMixin, MultiButtonControllerMixin
+
+
+class RecordingController(AbstractButtonControllerMixin):
+    """
+    Handles presses and releases of ok, logging them to calls and consuming presses when consume is set.
+    """
+
+    def __init__(self, name, calls, consume=False):
+        self.name = name
+        self.calls = calls
+        self.consume = consume
+        super(RecordingController, self).__init__()
+
+    def _setup_buttons(self):
+        self._setup_button("ok", 6, self._ok_pressed, self._ok_released)
+
+    def _ok_pressed(self):
+        self.calls.append((self.name, ACTION_PRESSED))
+        return self.consume
+
+    def _ok_released(self):
+        self.calls.append((self.name, ACTION_RELEASED))
+
+
+class Dispatcher(MultiButtonControllerMixin):
+    pass
+
+
+def event(action=ACTION_PRESSED, name="ok"):
+    return ButtonEvent(0, name, action, 0)
+
+
+class DispatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.dispatcher = Dispatcher()
+
+    def _controller(self, name, consume=False, front_of_queue=False):
+        controller = RecordingController(name, self.calls, consume)
+        self.dispatcher.register_controller(controller, front_of_queue)
+        return controller
+
+    def test_controllers_are_called_in_registration_order(self):
+        self._controller("first")
+        self._controller("second")
+        self._controller("front", front_of_queue=True)
+        self.assertFalse(self.dispatcher._handle_button_event(event()))
+        self.assertEqual([name for name, _ in self.calls], ["front", "first", "second"])
+
+    def test_consumed_events_skip_later_controllers(self):
+        self._controller("first")
+        self._controller("consumer", consume=True)
+        self._controller("last")
+        self.assertTrue(self.dispatcher._handle_button_event(event()))
+        self.assertEqual([name for name, _ in self.calls], ["first", "consumer"])
+
+    def test_consumption_is_per_action(self):
+        self._controller("consumer", consume=True)
+        self._controller("last")
+        self.dispatcher._handle_button_event(event(ACTION_RELEASED))
+        self.assertEqual(self.calls, [("consumer", ACTION_RELEASED), ("last", ACTION_RELEASED)])
+
+    def test_unregistered_controllers_are_not_called(self):
+        first = self._controller("first", consume=True)
+        self._controller("second")
+        self.dispatcher.unregister_controller(first)
+        self.dispatcher._handle_button_event(event())
+        self.assertEqual([name for name, _ in self.calls], ["second"])
+        self.dispatcher.unregister_controller(self.dispatcher._button_controllers[0])
+        self.assertFalse(self.dispatcher._handle_button_event(event()))
+        self.assertEqual(self.dispatcher._dispatch_index, {})
+
+    def test_unhandled_buttons_are_ignored(self):
+        self._controller("first")
+        self.assertFalse(self.dispatcher._handle_button_event(event(name="up")))
+        self.assertEqual(self.calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
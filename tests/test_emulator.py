@@ -0,0 +1,42 @@
+import random
+import unittest
+
+from emulator import EmulatedSSD1306, FakeI2CBus
+from framebuffer import PageFrameBuffer
+from tests import random_image
+
+
+class EmulatedSSD1306Test(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = random.Random(16)
+        self.screen = EmulatedSSD1306(0x3C)
+        self.screen.bus.reset_stats()
+
+    def test_screen_shows_frames(self):
+        for _ in xrange(5):
+            image = random_image(self.rng)
+            self.screen.draw_frame(PageFrameBuffer.from_image(image))
+            self.assertEqual(self.screen.to_image().tobytes(), image.tobytes())
+
+    def test_bus_counts_only_changes(self):
+        frame = PageFrameBuffer.from_image(random_image(self.rng))
+        self.screen.draw_frame(frame)
+        self.assertEqual(self.screen.bus.data_bytes, 1024)
+        self.screen.bus.reset_stats()
+        self.screen.draw_frame(frame.copy())
+        self.assertEqual(self.screen.bus.transactions, 0)
+        changed = frame.copy()
+        changed.rectangle((20, 9, 20, 9), fill=0 if changed.to_image().getpixel((20, 9)) else 255)
+        self.screen.draw_frame(changed)
+        self.assertEqual((self.screen.bus.commands, self.screen.bus.data_bytes), (1, 1))
+
+    def test_block_writes_are_bounded(self):
+        bus = FakeI2CBus(9)
+        self.assertRaises(ValueError, bus.write_block, 0x3C, 0x40, [0] * (FakeI2CBus.BLOCK_SIZE + 1))
+        self.screen.draw_frame(PageFrameBuffer(128, 64, fill=255))
+        self.assertEqual(self.screen.bus.wire_bytes, self.screen.bus.transactions * 2 + 6 * 8 + 1024)
+
+
+if __name__ == "__main__":
+    unittest.main()
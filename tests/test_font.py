@@ -0,0 +1,41 @@
+import unittest
+
+from PIL import ImageFont
+
+from tests import FONT_PATH
+from utils import Font, ImageFontTextWrapper
+
+SAMPLES = ["h", "hello", "hello, world!", "a ", " a", "  ", "Going on down to", "     South Park", "WAVE AV To.",
+           "Sensor channel 3 reports 21.4C at 40% relative humidity.", "0123456789 !\"#$%&'()*+,-./:;<=>?@[\\]^_`{|}~"]
+
+
+class FontMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.font = Font()
+        self.font.font = FONT_PATH, 8
+        self.image_font = ImageFont.truetype(FONT_PATH, 8)
+
+    def test_size_matches_getsize(self):
+        for text in SAMPLES:
+            self.assertEqual((self.font.get_width(text), self.font.get_height(text)), self.image_font.getsize(text),
+                             text)
+            # Again from the LRU.
+            self.assertEqual(self.font.get_width(text), self.image_font.getsize(text)[0], text)
+
+    def test_prefix_widths_never_decrease(self):
+        for text in SAMPLES:
+            widths = self.font.get_prefix_widths(text)
+            self.assertEqual(len(widths), len(text) + 1)
+            self.assertEqual(widths, sorted(widths), text)
+
+    def test_long_words_are_broken_at_the_widest_fit(self):
+        wrapper = ImageFontTextWrapper(width=40, font=self.font)
+        for line in wrapper.wrap("Supercalifragilisticexpialidocious, the long word"):
+            self.assertLessEqual(self.image_font.getsize(line)[0], 40, line)
+        first = wrapper.wrap("Supercalifragilisticexpialidocious")[0]
+        self.assertGreater(self.image_font.getsize("Supercalifragilisticexpialidocious"[:len(first) + 1])[0], 40)
+
+
+if __name__ == "__main__":
+    unittest.main()
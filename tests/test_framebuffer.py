@@ -0,0 +1,59 @@
+import random
+import unittest
+
+import numpy
+from PIL import Image, ImageDraw
+
+from framebuffer import PageFrameBuffer, pack_pages
+from tests import random_image
+
+
+class PageFrameBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = random.Random(21)
+
+    def test_pixel_lands_in_gddram_layout(self):
+        image = Image.new("1", (128, 64), 0)
+        image.putpixel((3, 10), 1)
+        frame = PageFrameBuffer.from_image(image)
+        # Page 1, bit 2 of the column counted from the right.
+        self.assertEqual(frame.pages[1, 127 - 3], 1 << 2)
+        self.assertEqual(frame.pages.sum(), 1 << 2)
+
+    def test_image_round_trip(self):
+        for _ in xrange(20):
+            image = random_image(self.rng)
+            self.assertEqual(PageFrameBuffer.from_image(image).to_image().tobytes(), image.tobytes())
+
+    def test_bytes_round_trip(self):
+        frame = PageFrameBuffer.from_image(random_image(self.rng))
+        self.assertEqual(PageFrameBuffer.from_bytes(128, 64, frame.tobytes()).tobytes(), frame.tobytes())
+
+    def test_drawing_matches_image_draw(self):
+        for _ in xrange(20):
+            image = Image.new("1", (128, 64), 0)
+            draw = ImageDraw.Draw(image)
+            frame = PageFrameBuffer(128, 64)
+            for _ in xrange(8):
+                left, top = self.rng.randint(-8, 128), self.rng.randint(-8, 64)
+                xy = (left, top, left + self.rng.randint(0, 40), top + self.rng.randint(0, 20))
+                fill, outline = self.rng.choice((0, 255, None)), self.rng.choice((0, 255, None))
+                if fill is None and outline is None:
+                    continue
+                draw.rectangle(xy, fill=fill, outline=outline)
+                frame.rectangle(xy, fill=fill, outline=outline)
+            mask = Image.new("L", (13, 9), 0)
+            ImageDraw.Draw(mask).ellipse((0, 0, 12, 8), fill=255)
+            draw.bitmap((50, 27), mask, fill=255)
+            frame.bitmap((50, 27), mask, fill=255)
+            self.assertEqual(frame.to_image().tobytes(), image.tobytes())
+
+    def test_pack_pages_with_shift(self):
+        pixels = numpy.zeros((3, 2), dtype=numpy.bool_)
+        pixels[0, 0] = pixels[2, 1] = True
+        # Rows start 6 into the first page, so the last row spills into a second one.
+        self.assertEqual(pack_pages(pixels, 6).tolist(), [[1 << 6, 0], [0, 1]])
+
+if __name__ == "__main__":
+    unittest.main()
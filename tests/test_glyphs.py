@@ -0,0 +1,90 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image, ImageDraw, ImageFont
+
+from framebuffer import PageFrameBuffer
+from glyphs import GlyphAtlas, PRINTABLE_ASCII
+from tests import ROOT
+
+FONTS = [(os.path.join(ROOT, "fonts", name), size) for name in ("Super-Mario-World.ttf", "ChronoType.ttf")
+         for size in (8, 12)]
+
+
+def sample_texts(rng):
+    texts = ["".join(PRINTABLE_ASCII), "Going on down to", "WAVE AV To.", "jg_|(!", "  "]
+    texts.extend("".join(rng.choice(PRINTABLE_ASCII) for _ in xrange(rng.randint(1, 14))) for _ in xrange(60))
+    return texts
+
+
+def draw_with_pillow(font, xy, text):
+    image = Image.new("1", (128, 64), 0)
+    ImageDraw.Draw(image).text(xy, text, font=font, fill=255)
+    return image
+
+
+class GlyphAtlasTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = random.Random(4)
+
+    def test_text_matches_image_draw(self):
+        for path, size in FONTS:
+            font = ImageFont.truetype(path, size)
+            atlas = GlyphAtlas(path, size)
+            for text in sample_texts(self.rng):
+                xy = (self.rng.randint(-4, 40), self.rng.randint(-4, 50))
+                image = Image.new("1", (128, 64), 0)
+                atlas.draw_text(ImageDraw.Draw(image), xy, text, 255)
+                self.assertEqual(image.tobytes(), draw_with_pillow(font, xy, text).tobytes(), (path, size, text))
+                frame = PageFrameBuffer(128, 64)
+                atlas.draw_text(frame, xy, text, 255)
+                self.assertEqual(frame.to_image().tobytes(), image.tobytes(), (path, size, text))
+
+    def test_width_matches_getsize(self):
+        for path, size in FONTS:
+            font = ImageFont.truetype(path, size)
+            atlas = GlyphAtlas(path, size)
+            for text in sample_texts(self.rng):
+                self.assertEqual(atlas.get_width(text), font.getsize(text)[0], (path, size, text))
+
+    def test_cached_glyphs_draw_the_same(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            path, size = FONTS[-1]
+            texts = sample_texts(self.rng)
+            drawn = GlyphAtlas(path, size, PRINTABLE_ASCII, cache_dir=cache_dir)
+            cached = GlyphAtlas(path, size, cache_dir=cache_dir)
+            for text in texts:
+                frames = PageFrameBuffer(128, 64), PageFrameBuffer(128, 64)
+                drawn.draw_text(frames[0], (3, 5), text, 255)
+                cached.draw_text(frames[1], (3, 5), text, 255)
+                self.assertEqual(frames[1].tobytes(), frames[0].tobytes(), text)
+            # Everything came from the file.
+            self.assertIsNone(cached._font)
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_new_glyphs_are_written_back_on_save(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            path, size = FONTS[0]
+            atlas = GlyphAtlas(path, size, "abc", cache_dir=cache_dir)
+            cache_path = atlas._cache_path
+            os.remove(cache_path)
+            atlas.save()
+            # Nothing new since the file was written.
+            self.assertFalse(os.path.exists(cache_path))
+            atlas.draw_text(PageFrameBuffer(128, 64), (0, 0), "xyz", 255)
+            self.assertFalse(os.path.exists(cache_path))
+            atlas.save()
+            self.assertEqual(sorted(GlyphAtlas(path, size, cache_dir=cache_dir)._glyphs), list("abcxyz"))
+        finally:
+            shutil.rmtree(cache_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
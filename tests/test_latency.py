@@ -0,0 +1,72 @@
+import unittest
+
+import glyphs
+from emulator import EmulatedSSD1306
+from input import ButtonEvent, ACTION_PRESSED
+from latency import LatencyTracer
+from tests import FONT_PATH
+from ui import MenuWindow, DualScreenWindowManager
+
+
+def setUpModule():
+    # Keep glyph cache files out of the home directory.
+    glyphs.GLYPH_CACHE_DIR = None
+
+
+def build_menu(title, count):
+    menu = MenuWindow(title, font=FONT_PATH)
+    for i in xrange(count):
+        menu.add_menu_item("Item {}".format(i), None)
+    return menu
+
+
+class LatencyTracerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.window_manager = DualScreenWindowManager(EmulatedSSD1306(0x3D), EmulatedSSD1306(0x3C))
+        self.root = build_menu("Root", 3)
+        self.window_manager.left_window = self.root
+        self.window_manager.right_window = build_menu("Right", 3)
+        self.window_manager.scheduler.flush()
+        self.tracer = LatencyTracer()
+        self.tracer.reset()
+
+    def _press(self, name):
+        self.window_manager._dispatch_button_event(ButtonEvent(0, name, ACTION_PRESSED, 0))
+
+    def _counts(self):
+        return dict((stage, histogram.count) for stage, histogram in self.tracer.histograms.items())
+
+    def test_press_is_traced_to_the_bus(self):
+        self._press("down")
+        self.assertEqual(self._counts()["total"], 0)
+        self.window_manager.scheduler.flush()
+        self.assertEqual(set(self._counts().values()), {1})
+        self.assertEqual(self.root.take_traces(), [])
+
+    def test_hidden_windows_complete_their_traces(self):
+        self._press("down")
+        self.window_manager.push_window(DualScreenWindowManager.LEFT, build_menu("Pushed", 2))
+        self.assertEqual(self.root.take_traces(), [])
+        self.window_manager.scheduler.flush()
+        counts = self._counts()
+        self.assertEqual((counts["handler"], counts["total"]), (1, 0))
+
+    def test_windows_off_screen_take_no_traces(self):
+        self.window_manager.push_window(DualScreenWindowManager.LEFT, build_menu("Pushed", 2))
+        self.tracer.begin(ButtonEvent(0, "down", ACTION_PRESSED, 0))
+        try:
+            self.root.invalidate()
+        finally:
+            self.tracer.end()
+        self.assertEqual(self.root.take_traces(), [])
+
+    def test_released_frames_complete_their_traces(self):
+        self._press("down")
+        self.root.release_frame()
+        self.assertEqual(self.root.take_traces(), [])
+        self.assertEqual(self._counts()["handler"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
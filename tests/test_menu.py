@@ -0,0 +1,98 @@
+import unittest
+
+import glyphs
+from datasource import AbstractMenuDataSource
+from emulator import EmulatedSSD1306
+from tests import FONT_PATH
+from ui import MenuItem, MenuWindow
+
+
+def setUpModule():
+    # Keep glyph cache files out of the home directory.
+    glyphs.GLYPH_CACHE_DIR = None
+
+
+class ListSource(AbstractMenuDataSource):
+
+    def __init__(self, titles):
+        super(ListSource, self).__init__()
+        self.titles = titles
+
+    def count(self):
+        return len(self.titles)
+
+    def get_items(self, start, stop):
+        return [MenuItem(title, None) for title in self.titles[start:stop]]
+
+
+def build_menu(title, count, screen=None):
+    menu = MenuWindow(title, font=FONT_PATH)
+    for i in xrange(count):
+        menu.add_menu_item("Item {}".format(i), None)
+    menu.screen = screen
+    return menu
+
+
+class MenuWindowTest(unittest.TestCase):
+
+    def test_position_is_clamped(self):
+        menu = build_menu("Clamp", 5, EmulatedSSD1306(0x3C))
+        menu.position = -5
+        self.assertEqual(menu.position, 0)
+        menu.position = 50
+        self.assertEqual(menu.position, 4)
+
+    def test_reload_after_the_source_empties(self):
+        screen = EmulatedSSD1306(0x3C)
+        menu = MenuWindow("Empty", font=FONT_PATH)
+        source = ListSource(["Item {}".format(i) for i in xrange(5)])
+        menu.data_source = source
+        menu.screen = screen
+        menu.position = 3
+        menu.redraw()
+        del source.titles[:]
+        menu.reload()
+        self.assertEqual(menu.position, -1)
+        menu.position = 2
+        self.assertEqual(menu.position, -1)
+        # Only the title is left on screen.
+        title_only = EmulatedSSD1306(0x3D)
+        build_menu("Empty", 0, title_only).redraw()
+        self.assertEqual(screen.to_image().tobytes(), title_only.to_image().tobytes())
+
+    def test_reload_after_the_source_shrinks(self):
+        menu = MenuWindow("Shrink", font=FONT_PATH)
+        source = ListSource(["Item {}".format(i) for i in xrange(12)])
+        menu.data_source = source
+        menu.screen = EmulatedSSD1306(0x3C)
+        menu.position = 11
+        del source.titles[3:]
+        menu.reload()
+        self.assertEqual(menu.position, 2)
+        self.assertEqual(menu._scroll, 0)
+
+    def test_partial_redraws_match_full_redraws(self):
+        screen = EmulatedSSD1306(0x3C)
+        menu = build_menu("Scroll", 12, screen)
+        menu.redraw()
+        for position in (1, 2, 5, 11, 10, 3, 0):
+            menu.position = position
+            menu.redraw()
+            partial = screen.to_image().tobytes()
+            menu.invalidate()
+            menu.redraw()
+            self.assertEqual(partial, screen.to_image().tobytes(), position)
+
+    def test_viewport_follows_the_selection(self):
+        menu = build_menu("Viewport", 12, EmulatedSSD1306(0x3C))
+        rows = menu._visible_rows(64)
+        menu.position = rows
+        self.assertEqual(menu._scroll, 1)
+        menu.position = 11
+        self.assertEqual(list(menu._visible_range(64))[-1], 11)
+        menu.position = 0
+        self.assertEqual(menu._scroll, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from emulator import EmulatedSSD1306
+from framebuffer import PageFrameBuffer
+from recording import FrameRecorder, FrameReplay, FILE_HEADER, MAGIC
+from tests import random_image
+
+
+class RecordingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = random.Random(19)
+        self.directory = tempfile.mkdtemp(prefix="pizzazz-tests-")
+        self.path = os.path.join(self.directory, "frames.pzr")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _record(self, count, keyframe_interval=None, addresses=(0x3C,)):
+        screens = [EmulatedSSD1306(address) for address in addresses]
+        recorder = FrameRecorder(self.path)
+        if keyframe_interval is not None:
+            recorder.KEYFRAME_INTERVAL = keyframe_interval
+        shown = []
+        for i in xrange(count):
+            screen = screens[i % len(screens)]
+            screen.recorder = recorder
+            screen.draw_frame(PageFrameBuffer.from_image(random_image(self.rng)))
+            shown.append((screen.name, screen.to_image().tobytes()))
+        recorder.close()
+        return shown
+
+    def _replayed(self):
+        replay = FrameReplay(self.path)
+        try:
+            return [(frame.screen, frame.image.tobytes()) for frame in replay]
+        finally:
+            replay.close()
+
+    def test_replay_matches_screens(self):
+        shown = self._record(12, keyframe_interval=4, addresses=(0x3C, 0x3D))
+        self.assertEqual(self._replayed(), shown)
+
+    def test_seeking_backwards(self):
+        shown = self._record(12, keyframe_interval=4)
+        replay = FrameReplay(self.path)
+        try:
+            for i in (11, 2, 7, 6, 0, 9):
+                self.assertEqual(replay.frame(i).image.tobytes(), shown[i][1])
+        finally:
+            replay.close()
+
+    def test_torn_record_is_dropped_on_append(self):
+        first = self._record(5, addresses=(0x3C,))
+        with open(self.path, "r+b") as recording:
+            recording.truncate(os.path.getsize(self.path) - 3)
+        self.assertEqual(self._replayed(), first[:4])
+        # The second session declares another screen first, reusing the first session's screen id for it.
+        second = self._record(6, addresses=(0x3D, 0x3C))
+        self.assertEqual(self._replayed(), first[:4] + second)
+
+    def test_refuses_other_versions(self):
+        with open(self.path, "wb") as recording:
+            recording.write(FILE_HEADER.pack(MAGIC, 1))
+        self.assertRaises(ValueError, FrameRecorder, self.path)
+        self.assertEqual(os.path.getsize(self.path), FILE_HEADER.size)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+import numpy
+
+import glyphs
+from framebuffer import PageFrameBuffer
+from render import Rect, TextRenderer
+from tests import FONT_PATH
+
+TEXT = "Going on down to South Park, gonna have myself a time."
+
+
+def setUpModule():
+    # Keep glyph cache files out of the home directory.
+    glyphs.GLYPH_CACHE_DIR = None
+
+
+class TextRendererTest(unittest.TestCase):
+
+    def setUp(self):
+        self.renderer = TextRenderer()
+        self.renderer.font = FONT_PATH, 8
+        self.renderer.text = TEXT
+
+    def _ink(self, rect):
+        frame = PageFrameBuffer(128, 64)
+        self.renderer.render(frame, rect, 255)
+        return numpy.asarray(frame.to_image().convert("L")) > 0
+
+    def test_text_stays_inside_the_rect(self):
+        for rect in (Rect(10, 10, 80, 20), Rect(0, 0, 127, 63), Rect(5, 3, 60, 30)):
+            ink = self._ink(rect)
+            rows, columns = numpy.nonzero(ink)
+            self.assertGreater(len(rows), 0, rect)
+            self.assertGreaterEqual(rows.min(), rect.top, rect)
+            self.assertLessEqual(rows.max(), rect.bottom, rect)
+            self.assertGreaterEqual(columns.min(), rect.left, rect)
+            self.assertLessEqual(columns.max(), rect.right, rect)
+
+    def test_only_whole_lines_are_drawn(self):
+        height = glyphs.get_atlas(FONT_PATH, 8).height
+        one_line = self._ink(Rect(10, 10, 80, 10 + height - 1))
+        self.assertTrue((self._ink(Rect(10, 10, 80, 10 + 2 * height - 2)) == one_line).all())
+        self.assertFalse((self._ink(Rect(10, 10, 80, 10 + 2 * height - 1)) == one_line).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import threading
+import unittest
+
+import scheduler
+from scheduler import FrameScheduler
+from stats import get_stats
+
+
+class FakeScreen(object):
+
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeWindow(object):
+
+    def __init__(self, title, screen):
+        self.title = title
+        self.screen = screen
+        self.redraws = 0
+        self.drawn = threading.Event()
+        self.fail = False
+
+    def redraw(self):
+        self.redraws += 1
+        self.drawn.set()
+        if self.fail:
+            raise RuntimeError("render failed")
+
+
+class FrameSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        scheduler.logger.disabled = True
+        self.scheduler = FrameScheduler(fps=20)
+        self.screen = FakeScreen("left")
+        get_stats().reset()
+
+    def tearDown(self):
+        self.scheduler.stop()
+        scheduler.logger.disabled = False
+
+    def test_requests_are_coalesced_into_one_redraw(self):
+        window = FakeWindow("Menu", self.screen)
+        for _ in xrange(5):
+            self.scheduler.request(window)
+        self.scheduler.flush()
+        self.assertEqual(window.redraws, 1)
+        self.scheduler.flush()
+        self.assertEqual(window.redraws, 1)
+
+    def test_only_the_latest_window_per_screen_is_drawn(self):
+        first = FakeWindow("First", self.screen)
+        second = FakeWindow("Second", self.screen)
+        other = FakeWindow("Other", FakeScreen("right"))
+        self.scheduler.request(first)
+        self.scheduler.request(other)
+        self.scheduler.request(second)
+        self.scheduler.flush()
+        self.assertEqual((first.redraws, second.redraws, other.redraws), (0, 1, 1))
+        self.assertEqual(get_stats().frames_skipped, {"left": 1})
+
+    def test_windows_off_screen_are_not_queued(self):
+        window = FakeWindow("Hidden", None)
+        self.scheduler.request(window)
+        self.scheduler.flush()
+        self.assertEqual(window.redraws, 0)
+
+    def test_failed_redraw_does_not_stop_the_flush(self):
+        broken = FakeWindow("Broken", self.screen)
+        broken.fail = True
+        other = FakeWindow("Other", FakeScreen("right"))
+        self.scheduler.request(broken)
+        self.scheduler.request(other)
+        self.scheduler.flush()
+        self.assertEqual((broken.redraws, other.redraws), (1, 1))
+
+    def test_thread_keeps_drawing_after_a_failed_redraw(self):
+        window = FakeWindow("Menu", self.screen)
+        window.fail = True
+        self.scheduler.start()
+        self.scheduler.request(window)
+        self.assertTrue(window.drawn.wait(5))
+        window.drawn.clear()
+        window.fail = False
+        self.scheduler.request(window)
+        self.assertTrue(window.drawn.wait(5))
+        self.assertTrue(self.scheduler.running)
+        self.assertEqual(window.redraws, 2)
+
+    def test_thread_keeps_animating_after_a_failed_animation(self):
+        ticks = []
+        ticked = threading.Event()
+
+        def broken():
+            raise RuntimeError("animation failed")
+
+        def tick():
+            ticks.append(1)
+            if len(ticks) >= 2:
+                ticked.set()
+
+        self.scheduler.animate(0.01, broken)
+        self.scheduler.animate(0.01, tick)
+        self.scheduler.start()
+        self.assertTrue(ticked.wait(5))
+        self.assertTrue(self.scheduler.running)
+
+
+if __name__ == "__main__":
+    unittest.main()
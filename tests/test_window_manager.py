@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import glyphs
+from emulator import EmulatedSSD1306
+from input import ButtonEvent, ACTION_PRESSED, ACTION_HELD
+from recording import FrameReplay
+from tests import FONT_PATH
+from ui import MenuWindow, WindowManager
+
+
+def setUpModule():
+    # Keep glyph cache files out of the home directory.
+    glyphs.GLYPH_CACHE_DIR = None
+
+
+def build_menu(title, count):
+    menu = MenuWindow(title, font=FONT_PATH)
+    for i in xrange(count):
+        menu.add_menu_item("Item {}".format(i), None)
+    return menu
+
+
+class FocusTest(unittest.TestCase):
+    """
+    Screens in a grid of two rows, the bottom one offset to the right:
+
+        a b c
+          d e
+    """
+
+    def setUp(self):
+        self.window_manager = WindowManager()
+        self.windows = {}
+        for address, (name, column, row) in enumerate([("a", 0, 0), ("b", 1, 0), ("c", 2, 0),
+                                                       ("d", 1, 1), ("e", 2, 1)]):
+            self.window_manager.add_screen(EmulatedSSD1306(0x30 + address), column, row, name)
+            self.windows[name] = build_menu(name, 2)
+            self.window_manager.set_window(name, self.windows[name])
+
+    def _send(self, name, action=ACTION_PRESSED):
+        self.window_manager._dispatch_button_event(ButtonEvent(0, name, action, 0))
+
+    def _focused(self):
+        focused = [name for name, window in self.windows.items() if window.focused]
+        self.assertEqual(len(focused), 1)
+        return focused[0]
+
+    def test_first_screen_is_focused(self):
+        self.assertEqual(self._focused(), "a")
+
+    def test_left_and_right_move_along_the_row(self):
+        self._send("right")
+        self.assertEqual(self._focused(), "b")
+        self._send("right")
+        self._send("right")
+        self.assertEqual(self._focused(), "c")
+        self._send("left")
+        self.assertEqual(self._focused(), "b")
+
+    def test_holding_up_and_down_moves_between_rows(self):
+        self._send("down", ACTION_HELD)
+        # Nothing straight below a; d is the nearest screen in the next row.
+        self.assertEqual(self._focused(), "d")
+        self._send("right")
+        self._send("up", ACTION_HELD)
+        self.assertEqual(self._focused(), "c")
+
+    def test_pressing_down_stays_with_the_window(self):
+        self._send("down")
+        self.assertEqual(self._focused(), "a")
+
+    def test_removing_the_focused_screen_moves_focus(self):
+        self.window_manager.focus_screen("c")
+        self.window_manager.remove_screen("c")
+        self.assertEqual(self._focused(), "a")
+        self.assertFalse(self.windows["c"].focused)
+
+
+class AddScreenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="pizzazz-tests-")
+        self.window_manager = WindowManager()
+        self.window_manager.add_screen(EmulatedSSD1306(0x3C))
+
+    def tearDown(self):
+        self.window_manager.stop_recording()
+        self.window_manager._stop_bus_workers()
+        shutil.rmtree(self.directory)
+
+    def test_screens_added_while_recording_are_recorded(self):
+        path = os.path.join(self.directory, "frames.pzr")
+        self.window_manager.start_recording(path)
+        late = EmulatedSSD1306(0x3D)
+        name = self.window_manager.add_screen(late)
+        self.window_manager.set_window(name, build_menu("Late", 2))
+        self.window_manager.scheduler.flush()
+        self.window_manager.stop_recording()
+        replay = FrameReplay(path)
+        try:
+            screens = [frame.screen for frame in replay]
+        finally:
+            replay.close()
+        self.assertIn(late.name, screens)
+
+    def test_screens_added_under_the_stats_overlay_show_it(self):
+        self.window_manager.show_stats_overlay()
+        late = EmulatedSSD1306(0x3D)
+        self.window_manager.add_screen(late)
+        self.assertIsNotNone(late.overlay)
+        self.window_manager.show_stats_overlay(False)
+        self.assertIsNone(late.overlay)
+
+    def test_screens_added_while_running_get_a_bus_worker(self):
+        self.window_manager._running = True
+        self.window_manager._start_bus_workers()
+        late = EmulatedSSD1306(0x3D, 5)
+        self.window_manager.add_screen(late)
+        self.assertIsNotNone(late.worker)
+        self.assertTrue(late.worker.running)
+        self.assertEqual(late.worker.port, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()